@@ -1,20 +1,59 @@
+import importlib
+
 import click
-from kaze.commands import create, query, info, chunks
 
+# Subcommands are imported on demand so that `kaze --help` and each command
+# only pay for the modules they actually use. Their short help is repeated
+# here so listing them doesn't import them.
+COMMANDS = {
+    "create": "Create embeddings for files in the project.",
+    "query": "Search for similar content across project files.",
+    "info": "Show information about the embeddings database.",
+    "chunks": "Commands for working with code chunks.",
+}
+
+
+class LazyGroup(click.Group):
+    """Click group that imports `kaze.commands.<name>` when a command is used."""
+
+    def list_commands(self, ctx):
+        return list(COMMANDS)
+
+    def format_commands(self, ctx, formatter):
+        # click's default resolves every command for its short help, which
+        # would import them all just to print `kaze --help`
+        with formatter.section("Commands"):
+            formatter.write_dl(list(COMMANDS.items()))
 
-@click.group()
+    def get_command(self, ctx, name):
+        if name not in COMMANDS:
+            return None
+        module = importlib.import_module(f"kaze.commands.{name}")
+        return getattr(module, name)
+
+
+@click.group(cls=LazyGroup)
+@click.option(
+    "-v", "--verbose", is_flag=True, help="Log each file and chunk as it is processed."
+)
 @click.pass_context
-def cli(ctx):
+def cli(ctx, verbose):
     """
     Kaze: Unified tool for creating and querying embeddings for project files.
     """
+    if verbose:
+        import logging
+
+        from rich.logging import RichHandler
+
+        # Only kaze's own loggers; the HTTP clients' debug output stays off
+        logger = logging.getLogger("kaze")
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(RichHandler(show_path=False))
+
     # Initialize configuration (or load from file) here if needed
     ctx.ensure_object(dict)  # Ensure there's a context object
 
 
-cli.add_command(create.create)
-cli.add_command(query.query)
-cli.add_command(info.info)
-cli.add_command(chunks.chunks)
 if __name__ == "__main__":
     cli()
@@ -6,11 +6,13 @@ Provides commands for managing and querying hierarchical code chunks.
 import click
 import os
 import json
+import signal
+import sqlite3
+import sys
 from rich import print
-import asyncio
-import sqlite_utils
+from rich.table import Table
 
-from kaze.core import treesitter_utils, db_utils, embedding_utils, file_utils
+from kaze.core import db_utils
 from kaze.utils import chunk_helpers
 
 
@@ -36,7 +38,7 @@ def chunks():
 @click.option("-b", "--batch", default=5, type=int, help="Batch size for processing.")
 @click.option("-c", "--collection", default="chunks", help="Collection name.")
 @click.option(
-    "-f", "--force", is_flag=True, help="Force recreation of embeddings database."
+    "-f", "--force", is_flag=True, help="Force recreation of the collection."
 )
 @click.option(
     "--include",
@@ -54,7 +56,17 @@ def chunks():
     "--sequential",
     is_flag=True,
     default=True,
-    help="Process files sequentially (recommended to avoid database locks).",
+    help="Chunk files one at a time; full chunk batches are still embedded and stored concurrently.",
+)
+@click.option(
+    "--ann",
+    is_flag=True,
+    help="Build a sqlite-vec index for faster queries (requires sqlite-vec).",
+)
+@click.option(
+    "--show-tokens",
+    is_flag=True,
+    help="Count each file's tokens with tiktoken instead of estimating them.",
 )
 def create(
     project_dir,
@@ -67,8 +79,17 @@ def create(
     include_pattern,
     exclude_pattern,
     sequential,
+    ann,
+    show_tokens,
 ):
     """Create code chunk embeddings for files in the project."""
+    # Only create needs the embedding pipeline; keep it out of the read commands
+    import asyncio
+
+    from rich.progress import Progress
+
+    from kaze.core import treesitter_utils, embedding_utils, file_utils
+
     project_dir = os.path.abspath(project_dir)
     kaze_dir = output_dir or os.path.join(project_dir, ".kaze")
     db_path = os.path.join(kaze_dir, "embeddings.db")
@@ -77,57 +98,35 @@ def create(
     print(f"[blue]💾 Chunk embeddings will be saved to [cyan]{db_path}[/cyan]")
     print(f"[blue]🧠 Using model: [cyan]{model}[/cyan]")
     print(
-        f"[blue]⚙️ Processing mode: [cyan]{'Sequential' if sequential else 'Batch'} (batch size: {batch})[/cyan]"
+        f"[blue]⚙️ Processing mode: [cyan]{'Sequential chunking, concurrent embedding' if sequential else 'Batch'} (batch size: {batch})[/cyan]"
     )
 
     os.makedirs(kaze_dir, exist_ok=True)
 
-    # Handle force flag - need to modify this to properly close connections
+    # Handle force flag
     if force and os.path.exists(db_path):
-        print("[yellow]⚠️ Force flag set - removing existing database[/yellow]")
-        # Ensure no connections to DB before removing
-        try:
-            # Try to release any existing connections explicitly
-            import sqlite3
-
-            conn = sqlite3.connect(db_path)
-            conn.close()
-            del conn
-        except:
-            pass
-
-        # Small delay to ensure connections are closed
-        import time
-
-        time.sleep(0.5)
-
+        print(
+            f"[yellow]⚠️ Force flag set - removing collection '{collection}'[/yellow]"
+        )
         try:
-            os.remove(db_path)
-            print("[green]✓ Removed existing database[/green]")
-        except Exception as e:
-            print(f"[red]❌ Error removing database: {str(e)}[/red]")
-            print(
-                "[yellow]⚠️ This may be due to open connections. Try closing them first.[/yellow]"
-            )
+            db = db_utils.open_db(db_path)
+            if db_utils.delete_collection(db, collection):
+                print(f"[green]✓ Removed existing collection '{collection}'[/green]")
+            db.close()
+        except sqlite3.DatabaseError as e:
+            print(f"[red]❌ Error removing collection: {str(e)}[/red]")
             return
 
     elif os.path.exists(db_path):
         # Check if collection exists - using a more robust approach
         try:
-            # Connect with a timeout to handle locks
-            import sqlite3
-
-            conn = sqlite3.connect(db_path, timeout=5.0)
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA journal_mode=WAL")
-            cursor.execute("PRAGMA busy_timeout=5000")
+            db = db_utils.open_db(db_path)
 
             # Check for collection
-            cursor.execute("SELECT name FROM collections WHERE name = ?", (collection,))
-            result = cursor.fetchone()
-            conn.close()
+            collection_id = db_utils.get_collection_id(db, collection)
+            db.close()
 
-            if result:
+            if collection_id is not None:
                 print(
                     f"[yellow]⚠️ Collection '{collection}' already exists in database[/yellow]"
                 )
@@ -135,16 +134,17 @@ def create(
                     "   [yellow]Use [green]--force[/green] to recreate the collection[/yellow]"
                 )
                 return
-        except Exception as e:
+        except sqlite3.DatabaseError as e:
             print(f"[yellow]⚠️ Error checking collections: {str(e)}[/yellow]")
             print("   [yellow]Continuing with database creation[/yellow]")
 
+    # Update should_process_file max size from parameter, before the walk
+    # that applies it
+    file_utils.should_process_file.max_file_size_kb = size
+
     # Get file list
     file_list = file_utils.get_file_list(project_dir, include_pattern, exclude_pattern)
 
-    # Update should_process_file max size from parameter
-    file_utils.should_process_file.max_file_size_kb = size
-
     if not file_list:
         print("[yellow]⚠️ No suitable files found to process[/yellow]")
         return
@@ -152,13 +152,17 @@ def create(
     print(f"[green]📊 Found [yellow]{len(file_list)}[/yellow] files to process[/green]")
 
     # Filter for files that have supported parsers
-    supported_files = []
-    for file_path in file_list:
-        language_id = treesitter_utils.detect_language(file_path)
-        if language_id:
-            supported_files.append(file_path)
-        else:
-            print(f"[yellow]⚠️ Skipping unsupported file type: {file_path}[/yellow]")
+    supported_files = [
+        file_path
+        for file_path in file_list
+        if treesitter_utils.detect_language(file_path)
+    ]
+
+    skipped_count = len(file_list) - len(supported_files)
+    if skipped_count:
+        print(
+            f"[yellow]⚠️ Skipping [yellow]{skipped_count}[/yellow] files with unsupported file types[/yellow]"
+        )
 
     if not supported_files:
         print("[yellow]⚠️ No supported files found to process[/yellow]")
@@ -169,8 +173,6 @@ def create(
     )
 
     # Add handler for graceful shutdown with Ctrl+C
-    import signal
-
     # Flag to track if processing should stop
     should_stop = False
 
@@ -185,58 +187,127 @@ def create(
             print(
                 "\n[red]❌ Forced exit. Database may be in an inconsistent state.[/red]"
             )
-            import sys
-
             sys.exit(1)
 
     # Set up the signal handler
     signal.signal(signal.SIGINT, signal_handler)
 
-    # Process files sequentially to avoid locking issues
+    # Chunk files in order, pooling their chunks so each embedding request
+    # carries a full batch; full batches go through a queue to MAX_INFLIGHT
+    # workers that embed and store them while chunking continues. Only the
+    # chunking is sequential: the workers write concurrently and rely on the
+    # connections' busy_timeout to wait for each other's locks
     async def process_files_sequential():
-        results = []
-
-        for i, file_path in enumerate(supported_files):
-            if should_stop:
-                print("[yellow]⚠️ Processing stopped due to user interrupt[/yellow]")
-                break
-
-            print(
-                f"[blue]Processing file {i+1}/{len(supported_files)}: {file_path}[/blue]"
-            )
-
-            # Process each file individually
-            success = await embedding_utils.embed_chunks(
-                file_path, model, db_path, collection
-            )
-            results.append(success)
-
-            # Add a progress indicator
-            success_count = results.count(True)
-            fail_count = len(results) - success_count
-            print(
-                f"[green]Progress: {i+1}/{len(supported_files)} ({success_count} succeeded, {fail_count} failed)[/green]"
-            )
-
-        return results
+        success_count = 0
+        fail_count = 0
+        pending_chunks = []
+        pending_files = 0
+        queue = asyncio.Queue(maxsize=embedding_utils.MAX_INFLIGHT)
+
+        async def consume():
+            nonlocal success_count, fail_count
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                batch_chunks, batch_files = batch
+                try:
+                    outcomes = await embedding_utils.embed_prepared_chunks(
+                        batch_chunks, model, db_path, collection
+                    )
+                except Exception as e:
+                    print(f"[yellow]⚠️ Failed to embed chunks: {str(e)}[/yellow]")
+                    outcomes = [False] * len(batch_chunks)
+                # A file counts as failed if any of its chunks did; a file's
+                # chunks are always pooled into the same batch
+                failed_files = len(
+                    {
+                        chunk["path"]
+                        for chunk, ok in zip(batch_chunks, outcomes)
+                        if not ok
+                    }
+                )
+                success_count += batch_files - failed_files
+                fail_count += failed_files
+
+        embedding_utils.ensure_collection(db_path, collection, model)
+        workers = [
+            asyncio.create_task(consume())
+            for _ in range(embedding_utils.MAX_INFLIGHT)
+        ]
+
+        async def flush():
+            nonlocal pending_chunks, pending_files
+            if pending_chunks:
+                # Waits for a free slot when the workers are behind
+                await queue.put((pending_chunks, pending_files))
+                # Yield once so an idle worker picks the batch up before the
+                # loop goes back to (blocking) chunking
+                await asyncio.sleep(0)
+            pending_chunks = []
+            pending_files = 0
+
+        # One progress bar updated in place instead of status lines per file
+        with Progress() as progress:
+            task = progress.add_task("Chunking files", total=len(supported_files))
+
+            for file_path in supported_files:
+                if should_stop:
+                    print("[yellow]⚠️ Processing stopped due to user interrupt[/yellow]")
+                    break
+
+                try:
+                    # Chunk in a worker thread so the event loop keeps
+                    # handing finished batches to the embedding workers
+                    chunks = await asyncio.to_thread(
+                        embedding_utils.prepare_chunks, file_path, show_tokens
+                    )
+                except Exception as e:
+                    print(f"[yellow]⚠️ Failed to chunk {file_path}: {str(e)}[/yellow]")
+                    chunks = []
+
+                progress.advance(task)
+
+                if not chunks:
+                    fail_count += 1
+                    continue
+
+                pending_chunks.extend(chunks)
+                pending_files += 1
+
+                if len(pending_chunks) >= embedding_utils.CHUNK_BATCH_SIZE:
+                    await flush()
+
+        # Embed whatever is left, including after an interrupt, then let
+        # the workers drain the queue
+        await flush()
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+        return success_count, fail_count
 
     # Process files in batches (legacy mode, more prone to locking)
     async def process_files_batch():
         results = await embedding_utils.embed_chunks_batch(
-            supported_files, model, db_path, collection, batch
+            supported_files, model, db_path, collection, batch, count_tokens=show_tokens
         )
-        return results
+        success_count = results.count(True)
+        return success_count, len(results) - success_count
 
     # Choose the processing function based on the sequential flag
     processing_func = process_files_sequential if sequential else process_files_batch
 
     try:
-        # Run the chosen processing function
-        results = asyncio.run(processing_func())
-
-        # Count successes and failures
-        success_count = results.count(True) if results else 0
-        fail_count = len(results) - success_count if results else 0
+        # Run the chosen processing function; into an otherwise empty chunks
+        # table, the full-text indexes are rebuilt once at the end rather
+        # than updated chunk by chunk
+        index_db = db_utils.open_db(db_path)
+        try:
+            with db_utils.deferred_chunk_search_indexes(index_db, collection):
+                success_count, fail_count = asyncio.run(processing_func())
+        finally:
+            index_db.close()
 
         print(
             f"\n[green]Processing complete! Successfully processed [yellow]{success_count}[/yellow] files, failed to process [yellow]{fail_count}[/yellow] files.[/green]"
@@ -250,12 +321,11 @@ def create(
                 f"[green]🔢 Database size: [yellow]{file_utils.get_file_size(db_path)}[/yellow][/green]"
             )
 
-            # Connect with a timeout to avoid locks when showing collections
             try:
-                import sqlite3
+                db = db_utils.open_db(db_path)
 
-                conn = sqlite3.connect(db_path, timeout=5.0)
-                db = sqlite_utils.Database(conn)
+                if ann:
+                    db_utils.build_vector_index(db, collection)
 
                 print("[green]📚 Collections in database:[/green]")
                 db_utils.show_collections(db_path)
@@ -264,8 +334,13 @@ def create(
                 chunk_count = db_utils.get_chunk_count(db_path, collection)
                 print(f"[green]🧩 Total chunks: [yellow]{chunk_count}[/yellow][/green]")
 
-                conn.close()
-            except Exception as e:
+                # Refresh planner statistics now that the chunks are written.
+                # The read commands open the database read-only and can't
+                # run ANALYZE themselves, so sqlite_stat1 is filled in here.
+                db.execute("ANALYZE chunks")
+                db.execute("PRAGMA optimize")
+                db.close()
+            except sqlite3.DatabaseError as e:
                 print(f"[yellow]⚠️ Error displaying database info: {str(e)}[/yellow]")
         else:
             print("[red]❌ Error: Failed to create embeddings database[/red]")
@@ -278,7 +353,7 @@ def create(
         print(f"[red]❌ Error processing files: {str(e)}[/red]")
 
 
-@chunks.command()
+@chunks.command(name="list")
 @click.option("-d", "--dir", "project_dir", default=".", help="Project directory.")
 @click.option(
     "-o",
@@ -293,7 +368,7 @@ def create(
     "-t", "--type", "chunk_type", help="Filter chunks by type (class, function, etc.)."
 )
 @click.option("--tree", is_flag=True, help="Display chunks as a tree.")
-def list(
+def list_chunks(
     project_dir,
     output_dir,
     collection,
@@ -314,66 +389,69 @@ def list(
         return
 
     # Connect to the database
-    db = sqlite_utils.Database(db_path)
+    db = db_utils.open_db(db_path, read_only=True)
 
     # Check if collection exists
-    if collection not in db_utils.list_collections(db):
+    collection_id = db_utils.get_collection_id(db, collection)
+    if collection_id is None:
         print(f"[red]Error: Collection '{collection}' not found in database[/red]")
         return
 
     print(f"[blue]📊 Listing chunks in collection: [cyan]{collection}[/cyan]")
 
     try:
-        # Query for chunks
-        collection_rows = list(
-            db.query("SELECT id FROM collections WHERE name = ?", [collection])
+        # Only the columns used for display; metadata is never shown here
+        query = (
+            "SELECT id, type, name, path, start_line, end_line, parent_id "
+            "FROM chunks WHERE collection_id = ?"
         )
-
-        if not collection_rows:
-            print(f"[red]Error: Collection '{collection}' not found in database[/red]")
-            return
-
-        collection_id = collection_rows[0]["id"]
-
-        query = "SELECT * FROM chunks WHERE collection_id = ?"
         params = [collection_id]
 
         if file_path:
-            query += " AND path LIKE ?"
-            params.append(f"%{file_path}%")
+            # Trigrams need at least three characters to match anything
+            if len(file_path) >= 3 and db_utils.has_chunk_path_index(db):
+                query += (
+                    " AND rowid IN (SELECT rowid FROM chunks_path_fts"
+                    " WHERE chunks_path_fts MATCH ?)"
+                )
+                params.append('"' + file_path.replace('"', '""') + '"')
+            else:
+                query += " AND path LIKE ?"
+                params.append(f"%{file_path}%")
 
         if chunk_type:
             query += " AND type = ?"
             params.append(chunk_type)
 
-        # Execute the query
-        chunk_rows = list(db.query(query, params))
-
-        # Convert to dictionaries
-        chunks = []
-        for row in chunk_rows:
-            chunk_dict = dict(row)
-            chunk_dict["metadata"] = json.loads(chunk_dict["metadata"])
-            chunks.append(chunk_dict)
-
-        if not chunks:
-            print("[yellow]⚠️ No chunks found matching the criteria.[/yellow]")
-            return
-
-        print(f"[green]📊 Found [yellow]{len(chunks)}[/yellow] chunks[/green]")
-
         # Display chunks
         if tree:
-            # Display as a tree
+            # The tree needs the whole forest, as dicts, before it can be drawn
+            chunks = list(db.query(query, params))
+
+            if not chunks:
+                print("[yellow]⚠️ No chunks found matching the criteria.[/yellow]")
+                return
+
+            print(f"[green]📊 Found [yellow]{len(chunks)}[/yellow] chunks[/green]")
             chunk_helpers.print_chunk_tree(chunks)
         else:
-            # Display as a list
-            for i, chunk in enumerate(chunks, 1):
+            # Display as a list, streaming plain tuples from the cursor
+            count = 0
+            rows = db.execute(query, params)
+            for count, (_, type_, name, path, start_line, end_line, _) in enumerate(
+                rows, 1
+            ):
                 print(
-                    f"[green]{i}.[/green] [cyan]{chunk['type']}[/cyan]:[yellow]{chunk['name']}[/yellow] "
-                    f"({chunk['path']}:{chunk['start_line']}-{chunk['end_line']})"
+                    f"[green]{count}.[/green] [cyan]{type_}[/cyan]:[yellow]{name}[/yellow] "
+                    f"({path}:{start_line}-{end_line})"
                 )
 
+            if not count:
+                print("[yellow]⚠️ No chunks found matching the criteria.[/yellow]")
+                return
+
+            print(f"[green]📊 Found [yellow]{count}[/yellow] chunks[/green]")
+
     except Exception as e:
         print(f"[red]Error listing chunks: {str(e)}[/red]")
 
@@ -404,6 +482,11 @@ def list(
     default=True,
     help="Display human-readable output instead of JSON.",
 )
+@click.option(
+    "--hybrid",
+    is_flag=True,
+    help="Also rank chunks by keyword matches on names, paths and content.",
+)
 def query(
     project_dir,
     output_dir,
@@ -414,6 +497,7 @@ def query(
     chunk_type,
     show_content,
     human_output,
+    hybrid,
 ):
     """Search for similar code chunks."""
     project_dir = os.path.abspath(project_dir)
@@ -433,10 +517,10 @@ def query(
         return
 
     # Connect to the database to check if collection exists
-    db = sqlite_utils.Database(db_path)
-    collections = db_utils.list_collections(db)
+    db = db_utils.open_db(db_path, read_only=True)
 
-    if collection not in collections:
+    if db_utils.get_collection_id(db, collection) is None:
+        collections = db_utils.list_collections(db)
         if human_output:
             print(f"[red]Error: Collection '{collection}' not found in database[/red]")
             print(f"Available collections: {', '.join(collections)}")
@@ -462,7 +546,7 @@ def query(
 
     # Get the results
     results = db_utils.query_chunks(
-        db_path, collection, query_text, limit, threshold, chunk_type
+        db_path, collection, query_text, limit, threshold, chunk_type, hybrid=hybrid
     )
 
     if not results:
@@ -472,7 +556,25 @@ def query(
             print("[]")  # Empty JSON array
         return
 
-    if human_output:
+    if human_output and not show_content:
+        # Without content every result fits on one row, so render a single
+        # table instead of several markup-parsed prints per result
+        table = Table("#", "Type", "Name", "Score", "File", "Lines", "Parent")
+        for idx, chunk in enumerate(results, 1):
+            table.add_row(
+                str(idx),
+                chunk["type"],
+                chunk["name"],
+                f"{round(chunk['score'] * 100, 1)}%",
+                chunk["path"],
+                f"{chunk['start_line']}-{chunk['end_line']}",
+                chunk.get("parent_id") or "",
+            )
+
+        print("[green]📋 Search results:[/green]")
+        print(table)
+        print(f"[green]🎉 Found {len(results)} matching chunks![/green]")
+    elif human_output:
         # Display results
         print("[green]📋 Search results:[/green]")
         print("-------------------------------------------")
@@ -495,14 +597,14 @@ def query(
             if chunk.get("parent_id"):
                 print(f"    Parent: [green]{chunk['parent_id']}[/green]")
 
-            if show_content:
-                chunk_helpers.display_chunk(chunk)
+            chunk_helpers.display_chunk(chunk)
 
             print("-------------------------------------------")
 
         print(f"[green]🎉 Found {len(results)} matching chunks![/green]")
     else:
-        print(json.dumps(results))
+        # Metadata comes back as db_utils.LazyJSON, which json can't encode
+        print(json.dumps(results, default=dict))
 
 
 @chunks.command()
@@ -541,24 +643,14 @@ def show(
         return
 
     # Connect to the database
-    db = sqlite_utils.Database(db_path)
+    db = db_utils.open_db(db_path, read_only=True)
 
     # Check if collection exists
-    if collection not in db_utils.list_collections(db):
+    collection_id = db_utils.get_collection_id(db, collection)
+    if collection_id is None:
         print(f"[red]Error: Collection '{collection}' not found in database[/red]")
         return
 
-    # Get the collection ID
-    collection_rows = list(
-        db.query("SELECT id FROM collections WHERE name = ?", [collection])
-    )
-
-    if not collection_rows:
-        print(f"[red]Error: Collection '{collection}' not found in database[/red]")
-        return
-
-    collection_id = collection_rows[0]["id"]
-
     # Get the chunk
     chunk_rows = list(
         db.query(
@@ -584,56 +676,58 @@ def show(
     if show_ancestors:
         print("[blue]🌳 Chunk Ancestors:[/blue]")
 
-        # Get all chunks to find ancestors
-        all_chunks = list(
-            db.query("SELECT * FROM chunks WHERE collection_id = ?", [collection_id])
-        )
-
-        # Convert to dictionaries
-        all_chunk_dicts = []
-        for row in all_chunks:
-            chunk_dict = dict(row)
-            chunk_dict["metadata"] = json.loads(chunk_dict["metadata"])
-            all_chunk_dicts.append(chunk_dict)
-
-        # Find ancestors
-        ancestors = chunk_helpers.get_chunk_ancestors(all_chunk_dicts, chunk_id)
+        # Walk up the parent chain in SQLite, ordered from immediate parent to root
+        ancestors = db.execute(
+            """
+            WITH RECURSIVE ancestors(
+                id, parent_id, type, name, path, start_line, end_line, depth
+            ) AS (
+                SELECT id, parent_id, type, name, path, start_line, end_line, 0
+                FROM chunks WHERE id = :chunk_id AND collection_id = :collection_id
+                UNION ALL
+                SELECT c.id, c.parent_id, c.type, c.name, c.path,
+                    c.start_line, c.end_line, ancestors.depth + 1
+                FROM chunks c
+                JOIN ancestors ON c.id = ancestors.parent_id
+                WHERE c.collection_id = :collection_id
+            )
+            SELECT type, name, path, start_line, end_line
+            FROM ancestors WHERE depth > 0 ORDER BY depth
+            """,
+            {"chunk_id": chunk_id, "collection_id": collection_id},
+        ).fetchall()
 
         if not ancestors:
             print("   [yellow]No ancestors found[/yellow]")
         else:
-            for i, ancestor in enumerate(ancestors, 1):
+            for i, (type_, name, path, start_line, end_line) in enumerate(
+                ancestors, 1
+            ):
                 print(
-                    f"   {i}. [cyan]{ancestor['type']}[/cyan]:[yellow]{ancestor['name']}[/yellow] "
-                    f"({ancestor['path']}:{ancestor['start_line']}-{ancestor['end_line']})"
+                    f"   {i}. [cyan]{type_}[/cyan]:[yellow]{name}[/yellow] "
+                    f"({path}:{start_line}-{end_line})"
                 )
 
     # Show children if requested
     if show_children:
         print("[blue]🌱 Chunk Children:[/blue]")
 
-        # Get children directly from the database
-        children = list(
-            db.query(
-                "SELECT * FROM chunks WHERE parent_id = ? AND collection_id = ?",
-                [chunk_id, collection_id],
-            )
-        )
-
-        # Convert to dictionaries
-        child_chunks = []
-        for row in children:
-            child_dict = dict(row)
-            child_dict["metadata"] = json.loads(child_dict["metadata"])
-            child_chunks.append(child_dict)
+        # Get children directly from the database, only the displayed columns
+        child_chunks = db.execute(
+            "SELECT type, name, path, start_line, end_line FROM chunks "
+            "WHERE parent_id = ? AND collection_id = ?",
+            [chunk_id, collection_id],
+        ).fetchall()
 
         if not child_chunks:
             print("   [yellow]No children found[/yellow]")
         else:
-            for i, child in enumerate(child_chunks, 1):
+            for i, (type_, name, path, start_line, end_line) in enumerate(
+                child_chunks, 1
+            ):
                 print(
-                    f"   {i}. [cyan]{child['type']}[/cyan]:[yellow]{child['name']}[/yellow] "
-                    f"({child['path']}:{child['start_line']}-{child['end_line']})"
+                    f"   {i}. [cyan]{type_}[/cyan]:[yellow]{name}[/yellow] "
+                    f"({path}:{start_line}-{end_line})"
                 )
 
 
@@ -665,82 +759,49 @@ def stats(
         return
 
     # Connect to the database
-    db = sqlite_utils.Database(db_path)
+    db = db_utils.open_db(db_path, read_only=True)
 
     # Check if collection exists
-    if collection not in db_utils.list_collections(db):
+    collection_id = db_utils.get_collection_id(db, collection)
+    if collection_id is None:
         print(f"[red]Error: Collection '{collection}' not found in database[/red]")
         return
 
     print(f"[blue]📊 Chunk Statistics for Collection: [cyan]{collection}[/cyan]")
 
     try:
-        # Get the collection ID
-        collection_rows = list(
-            db.query("SELECT id FROM collections WHERE name = ?", [collection])
-        )
-
-        if not collection_rows:
-            print(f"[red]Error: Collection '{collection}' not found in database[/red]")
-            return
-
-        collection_id = collection_rows[0]["id"]
-
-        # Get total chunk count
-        total_rows = list(
-            db.query(
-                "SELECT COUNT(*) as count FROM chunks WHERE collection_id = ?",
-                [collection_id],
-            )
-        )
-        total_chunks = total_rows[0]["count"] if total_rows else 0
+        # Get total, top-level and nested counts in a single pass
+        total_chunks, top_level_count, nested_count = db.execute(
+            "SELECT COUNT(*), "
+            "COALESCE(SUM(parent_id IS NULL), 0), "
+            "COALESCE(SUM(parent_id IS NOT NULL), 0) "
+            "FROM chunks WHERE collection_id = ?",
+            [collection_id],
+        ).fetchone()
 
         print(f"[green]📈 Total Chunks: [yellow]{total_chunks}[/yellow]")
 
         # Count by type
         print("[green]📊 Chunks by Type:[/green]")
-        type_counts = list(
-            db.query(
-                "SELECT type, COUNT(*) as count FROM chunks "
-                "WHERE collection_id = ? GROUP BY type ORDER BY count DESC",
-                [collection_id],
-            )
+        type_counts = db.execute(
+            "SELECT type, COUNT(*) as count FROM chunks "
+            "WHERE collection_id = ? GROUP BY type ORDER BY count DESC",
+            [collection_id],
         )
 
-        for row in type_counts:
-            print(f"   [cyan]{row['type']}[/cyan]: [yellow]{row['count']}[/yellow]")
+        for chunk_type, count in type_counts:
+            print(f"   [cyan]{chunk_type}[/cyan]: [yellow]{count}[/yellow]")
 
         # Count by file (top 10)
         print("[green]📊 Files with Most Chunks (Top 10):[/green]")
-        file_counts = list(
-            db.query(
-                "SELECT path, COUNT(*) as count FROM chunks "
-                "WHERE collection_id = ? GROUP BY path ORDER BY count DESC LIMIT 10",
-                [collection_id],
-            )
+        file_counts = db.execute(
+            "SELECT path, COUNT(*) as count FROM chunks "
+            "WHERE collection_id = ? GROUP BY path ORDER BY count DESC LIMIT 10",
+            [collection_id],
         )
 
-        for row in file_counts:
-            print(f"   [blue]{row['path']}[/blue]: [yellow]{row['count']}[/yellow]")
-
-        # Count top-level vs. nested chunks
-        top_level_rows = list(
-            db.query(
-                "SELECT COUNT(*) as count FROM chunks "
-                "WHERE collection_id = ? AND parent_id IS NULL",
-                [collection_id],
-            )
-        )
-        top_level_count = top_level_rows[0]["count"] if top_level_rows else 0
-
-        nested_rows = list(
-            db.query(
-                "SELECT COUNT(*) as count FROM chunks "
-                "WHERE collection_id = ? AND parent_id IS NOT NULL",
-                [collection_id],
-            )
-        )
-        nested_count = nested_rows[0]["count"] if nested_rows else 0
+        for path, count in file_counts:
+            print(f"   [blue]{path}[/blue]: [yellow]{count}[/yellow]")
 
         print("[green]📊 Chunk Hierarchy:[/green]")
         print(f"   [cyan]Top-level chunks[/cyan]: [yellow]{top_level_count}[/yellow]")
@@ -749,35 +810,37 @@ def stats(
         # Nesting depth stats
         print("[green]📊 Nesting Depth:[/green]")
 
-        # This requires recursive querying which is complex in SQLite
-        # So we'll fetch all chunks and analyze in Python
-        all_chunks = list(
-            db.query(
-                "SELECT id, parent_id FROM chunks WHERE collection_id = ?",
-                [collection_id],
+        # Walk the hierarchy inside SQLite. Chunks whose parent is missing
+        # from the collection are counted at root level.
+        depth_rows = db.execute(
+            """
+            WITH RECURSIVE depths(id, depth) AS (
+                SELECT c.id, 0 FROM chunks c
+                WHERE c.collection_id = :collection_id
+                AND (
+                    c.parent_id IS NULL
+                    OR c.parent_id = ''
+                    OR NOT EXISTS (
+                        SELECT 1 FROM chunks p
+                        WHERE p.id = c.parent_id
+                        AND p.collection_id = :collection_id
+                    )
+                )
+                UNION ALL
+                SELECT c.id, depths.depth + 1 FROM chunks c
+                JOIN depths ON c.parent_id = depths.id
+                WHERE c.collection_id = :collection_id
             )
+            SELECT depth, COUNT(*) as count FROM depths
+            GROUP BY depth ORDER BY depth
+            """,
+            {"collection_id": collection_id},
         )
 
-        # Build a lookup table to efficiently find parents
-        chunk_by_id = {row["id"]: row for row in all_chunks}
-
-        # Calculate depths
-        depths = {}
-        for chunk in all_chunks:
-            depth = 0
-            current = chunk
-            while current.get("parent_id") and current["parent_id"] in chunk_by_id:
-                depth += 1
-                current = chunk_by_id[current["parent_id"]]
-
-            if depth not in depths:
-                depths[depth] = 0
-            depths[depth] += 1
-
         # Display depth statistics
-        for depth in sorted(depths.keys()):
+        for depth, count in depth_rows:
             level_name = "Root level" if depth == 0 else f"Level {depth}"
-            print(f"   [cyan]{level_name}[/cyan]: [yellow]{depths[depth]}[/yellow]")
+            print(f"   [cyan]{level_name}[/cyan]: [yellow]{count}[/yellow]")
 
     except Exception as e:
         print(f"[red]Error calculating chunk statistics: {str(e)}[/red]")
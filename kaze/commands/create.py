@@ -1,10 +1,8 @@
 import click
-import llm
 from kaze.core import file_utils, embedding_utils, db_utils
 import os
 from rich import print
 import asyncio
-import sqlite_utils
 
 
 @click.command()
@@ -20,10 +18,12 @@ import sqlite_utils
     "-m", "--model", default="text-embedding-3-small", help="Embedding model to use."
 )
 @click.option("-s", "--size", default=100, type=int, help="Maximum file size in KB.")
-@click.option("-b", "--batch", default=20, type=int, help="Batch size for processing.")
+@click.option(
+    "-b", "--batch", default=100, type=int, help="Files per embedding request."
+)
 @click.option("-c", "--collection", default="files", help="Collection name.")
 @click.option(
-    "-f", "--force", is_flag=True, help="Force recreation of embeddings database."
+    "-f", "--force", is_flag=True, help="Force recreation of the collection."
 )
 @click.option(
     "--include",
@@ -42,6 +42,16 @@ import sqlite_utils
     is_flag=True,
     help="Verify embedding model is available.",
 )
+@click.option(
+    "--ann",
+    is_flag=True,
+    help="Build a sqlite-vec index for faster queries (requires sqlite-vec).",
+)
+@click.option(
+    "--show-tokens",
+    is_flag=True,
+    help="Count each file's tokens with tiktoken instead of estimating them.",
+)
 def create(
     project_dir,
     output_dir,
@@ -53,6 +63,8 @@ def create(
     include_pattern,
     exclude_pattern,
     verify,
+    ann,
+    show_tokens,
 ):
     """Create embeddings for files in the project."""
 
@@ -68,7 +80,7 @@ def create(
     if verify:
         try:
             print(f"[blue]🔍 Verifying embedding model: [cyan]{model}[/cyan]")
-            embedding_model = llm.get_embedding_model(model)
+            embedding_model = embedding_utils.get_embedding_model(model)
             print(f"[green]✅ Model verified: [cyan]{embedding_model.model_id}[/cyan]")
         except Exception as e:
             print(f"[red]❌ Error: Could not load embedding model '{model}': {e}[/red]")
@@ -77,17 +89,18 @@ def create(
     os.makedirs(kaze_dir, exist_ok=True)
 
     # Initialize the database
-    db = sqlite_utils.Database(db_path)
+    db = db_utils.open_db(db_path)
 
     # Handle force flag
-    if force and os.path.exists(db_path):
-        print("[yellow]⚠️ Force flag set - removing existing database[/yellow]")
-        os.remove(db_path)
-        db = sqlite_utils.Database(db_path)  # Reconnect to the new DB
-    elif os.path.exists(db_path):
+    if force:
+        if db_utils.delete_collection(db, collection):
+            print(
+                f"[yellow]⚠️ Force flag set - removed existing collection '{collection}'[/yellow]"
+            )
+    else:
         # Check if collection exists
         try:
-            if collection in db_utils.list_collections(db):
+            if db_utils.get_collection_id(db, collection) is not None:
                 print(f"[yellow]⚠️ Collection '{collection}' already exists in database")
                 print(
                     "   Use [green]--force[/green] to recreate the collection[/yellow]"
@@ -97,27 +110,29 @@ def create(
             print(f"[yellow]⚠️ Error checking collections: {e}[/yellow]")
             print("   Continuing with database creation")
 
-    # Get file list
-    file_list = file_utils.get_file_list(project_dir, include_pattern, exclude_pattern)
-
     # Update should_process_file max size from parameter
     file_utils.should_process_file.max_file_size_kb = size
 
-    if not file_list:
-        print("[yellow]⚠️ No suitable files found to process[/yellow]")
-        return
-
-    print(f"[green]📊 Found [yellow]{len(file_list)}[/yellow] files to process[/green]")
+    # Files are embedded while the project is still being walked
+    file_list = file_utils.iter_files(project_dir, include_pattern, exclude_pattern)
 
     # Process files in batches using async
     async def process_files():
         results = await embedding_utils.embed_files_batch(
-            file_list, model, db_path, collection, batch
+            file_list, model, db_path, collection, batch, count_tokens=show_tokens
         )
         return results
 
     # Run the async batch processing
-    results = asyncio.run(process_files())
+    try:
+        results = asyncio.run(process_files())
+    except Exception as e:
+        print(f"[red]❌ Error embedding files: {str(e)}[/red]")
+        return
+
+    if not results:
+        print("[yellow]⚠️ No suitable files found to process[/yellow]")
+        return
 
     # Count successes and failures
     success_count = results.count(True) if results else 0
@@ -127,6 +142,9 @@ def create(
         f"\n[green]Processing complete! Successfully processed [yellow]{success_count}[/yellow] files, failed to process [yellow]{fail_count}[/yellow] files.[/green]"
     )
 
+    if ann:
+        db_utils.build_vector_index(db, collection)
+
     if os.path.exists(db_path):
         print(
             f"[green]✅ Embeddings successfully created and saved to [cyan]{db_path}[/cyan]"
@@ -5,7 +5,6 @@ from kaze.core import db_utils
 from kaze.utils import display
 import os
 from rich import print
-import sqlite_utils
 
 
 @click.command()
@@ -69,20 +68,11 @@ def query(
             print(json.dumps({"error": "Database not found", "path": db_path}))
         return
 
-    # Connect to the database to check if collection exists
-    db = sqlite_utils.Database(db_path)
-    collections = []
-    try:
-        collections = db_utils.list_collections(db)
-    except Exception as e:
-        print(f"[yellow]Warning: Error listing collections: {e}[/yellow]")
-        try:
-            rows = db.query("SELECT name FROM collections")
-            collections = [row["name"] for row in rows]
-        except Exception as inner_e:
-            print(f"[red]Error querying collections table: {inner_e}[/red]")
+    # Open the database once for the collection check and the search
+    db = db_utils.open_db(db_path)
 
-    if collection not in collections:
+    if db_utils.get_collection_id(db, collection) is None:
+        collections = db_utils.list_collections(db)
         if human_output:
             print(f"[red]Error: Collection '{collection}' not found in database[/red]")
             print(f"Available collections: {', '.join(collections)}")
@@ -107,13 +97,13 @@ def query(
     # Get the results
     if best:
         # Get only the best result
-        results = [db_utils.find_most_similar(db_path, collection, query_text)]
+        results = [db_utils.find_most_similar(db, collection, query_text)]
         if results[0] is None:
             results = []
     else:
         # Get multiple results
         results = db_utils.query_embeddings(
-            db_path, collection, query_text, limit, threshold
+            db, collection, query_text, limit, threshold
         )
 
     if not results:
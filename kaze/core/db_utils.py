@@ -1,41 +1,226 @@
-import llm
+import atexit
+import contextlib
+import hashlib
+import json
+import logging
+import math
+import operator
+import os
+import pathlib
+import re
 import sqlite3
 import sqlite_utils
+import struct
+import time
+from collections.abc import Mapping
+from itertools import islice
 from rich import print
 
+logger = logging.getLogger(__name__)
 
-def query_embeddings(db_path, collection_name, query_text, limit, threshold):
-    """Queries the embeddings database and returns results using the Collection class approach."""
+# orjson is optional; it decodes and encodes the metadata column several
+# times faster than the standard library when installed
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_dumps(value):
+        return orjson.dumps(value).decode()
+
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+# sqlite-vec is optional; with it installed a collection can be given a
+# vec0 index that similar_by_vector searches in C instead of scanning
+try:
+    import sqlite_vec
+except ImportError:
+    sqlite_vec = None
+
+
+def _dot(a, b):
+    """Dot product of two equal-length float sequences."""
+    return sum(map(operator.mul, a, b))
+
+
+# math.sumprod (Python 3.12+) does the multiply-add loop in C
+if hasattr(math, "sumprod"):
+    _dot = math.sumprod
+
+
+class LazyJSON(Mapping):
+    """
+    Read-only mapping over a stored JSON object, decoded on first access.
+
+    Chunk queries return the metadata column wrapped in this, so results
+    whose metadata is never displayed don't pay for json.loads. Use
+    json.dumps(..., default=dict) to serialize results that contain it.
+    """
+
+    __slots__ = ("_text", "_value")
+
+    def __init__(self, text):
+        self._text = text
+        self._value = None
+
+    def _decoded(self):
+        if self._value is None:
+            self._value = json_loads(self._text) if self._text else {}
+        return self._value
+
+    def __getitem__(self, key):
+        return self._decoded()[key]
+
+    def __iter__(self):
+        return iter(self._decoded())
+
+    def __len__(self):
+        return len(self._decoded())
+
+    def __repr__(self):
+        return repr(self._decoded())
+
+
+def open_db(db_path, read_only=False):
+    """
+    Open the embeddings database with tuned connection settings.
+
+    Writable connections switch the database to WAL with synchronous=NORMAL,
+    so readers don't block the writer and commits need fewer fsyncs.
+    Read-only connections are opened with mode=ro and never take a write lock;
+    they also set query_only, so callers can tell them apart.
+
+    Args:
+        db_path: Path to the SQLite database
+        read_only: Whether to open the database in read-only mode
+
+    Returns:
+        A sqlite_utils.Database wrapping the configured connection
+    """
+    if read_only:
+        uri = pathlib.Path(db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")  # About 256MB
+    conn.execute("PRAGMA mmap_size=268435456")  # 256MB
+    return sqlite_utils.Database(conn)
+
+
+# Connections handed out by get_db, keyed by (real path, read_only)
+_DB_CACHE = {}
+
+
+def get_db(db_path, read_only=False):
+    """
+    Return a cached open_db connection for db_path, opening it on first use.
+
+    Helpers that the CLI calls several times per command share one
+    connection this way instead of reconnecting and re-applying the
+    pragmas on every call. Callers must not close the returned database;
+    the cached connections are closed at exit.
+
+    Args:
+        db_path: Path to the SQLite database
+        read_only: Whether to open the database in read-only mode
+
+    Returns:
+        A sqlite_utils.Database wrapping the cached connection
+    """
+    key = (os.path.realpath(db_path), read_only)
+    db = _DB_CACHE.get(key)
+    if db is None:
+        db = _DB_CACHE[key] = open_db(key[0], read_only=read_only)
+    return db
+
+
+@atexit.register
+def _close_cached_dbs():
+    for db in _DB_CACHE.values():
+        db.close()
+    _DB_CACHE.clear()
+
+
+def delete_collection(db, collection_name):
+    """
+    Delete a collection with its embeddings and chunks in one transaction.
+
+    Other collections in the database are left untouched, and the schema
+    and indexes don't have to be rebuilt the way they would after deleting
+    the database file.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection_name: Name of the collection to delete
+
+    Returns:
+        True if the collection existed and was deleted
+    """
+    collection_id = get_collection_id(db, collection_name)
+    if collection_id is None:
+        return False
+
+    conn = db.conn
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        # Connect to the database
-        db = sqlite_utils.Database(db_path)
+        if db["chunks"].exists():
+            conn.execute("DELETE FROM chunks WHERE collection_id = ?", [collection_id])
+        conn.execute("DELETE FROM embeddings WHERE collection_id = ?", [collection_id])
+        conn.execute("DELETE FROM collections WHERE id = ?", [collection_id])
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+
+    # Collection ids can be reused, so don't leave its vector index behind
+    drop_vector_index(db, collection_id)
+
+    # A recreated collection gets a new id, so forget the cached one
+    for cached_db in [db, *_DB_CACHE.values()]:
+        cached_db.__dict__.get("_kaze_collection_ids", {}).pop(collection_name, None)
+    return True
+
 
+def query_embeddings(db, collection_name, query_text, limit, threshold):
+    """
+    Queries the embeddings database for the entries most similar to a text.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection_name: Name of the collection to search
+        query_text: Text to search for
+        limit: Maximum number of results
+        threshold: Minimum similarity score for a result
+
+    Returns:
+        List of {"id", "score", "content", "metadata"} dicts, best first
+    """
+    try:
         # Check if collection exists
-        if not llm.Collection.exists(db, collection_name):
+        collection_id = get_collection_id(db, collection_name)
+        if collection_id is None:
             print(
                 f"[red]Collection '{collection_name}' does not exist in the database[/red]"
             )
             return []
 
-        # Get the collection
+        # Embed the query with the collection's model; llm is imported here
+        # so the commands that only read chunks never load it
+        import llm
+
         collection = llm.Collection(collection_name, db)
+        query_vector = embed_query(db, collection, query_text)
 
-        # Query for similar documents
-        results = collection.similar(query_text, number=limit)
-
-        # Filter by threshold and convert to serializable dictionaries
-        serializable_results = []
-        for entry in results:
-            if entry.score >= threshold:
-                result_dict = {
-                    "id": entry.id,
-                    "score": entry.score,
-                    "content": entry.content,  # Will be None if not stored
-                    "metadata": entry.metadata,  # Will be None if not stored
-                }
-                serializable_results.append(result_dict)
-
-        return serializable_results
+        # Query for similar documents scoring at least the threshold
+        return similar_by_vector(db, collection_id, query_vector, limit, threshold)
     except sqlite3.OperationalError as e:
         print(f"[red]Database error: {str(e)}[/red]")
         return []
@@ -48,74 +233,116 @@ def get_db_size(db_path):
     """
     Returns the size of the file in human readable format
     """
-    import os
-    import math
-
     file_size = os.path.getsize(db_path)
     size_name = ("B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB")
-    i = int(math.floor(math.log(file_size, 1024)))
-    p = math.pow(1024, i)
-    s = round(file_size / p, 2)
+    # Each unit is 2**10 of the previous one; max() keeps an empty file at "B"
+    i = min((max(file_size, 1).bit_length() - 1) // 10, len(size_name) - 1)
+    s = round(file_size / (1 << (i * 10)), 2)
     return f"{s} {size_name[i]}"
 
 
 def list_collections(db):
     """List all collections in the database."""
     try:
-        tables = [
-            t["name"]
-            for t in db.query("SELECT name FROM sqlite_master WHERE type='table'")
-        ]
-        if "collections" in tables:
-            rows = db.query("SELECT name FROM collections")
-            return [row["name"] for row in rows]
+        # Query the table directly; a missing table is cheaper to catch than
+        # to look up in sqlite_master first
+        return [row[0] for row in db.execute("SELECT name FROM collections")]
+    except sqlite3.OperationalError:
+        # No collections table yet
         return []
     except Exception as e:
         print(f"[red]Error listing collections: {str(e)}[/red]")
         return []
 
 
+def get_collection_id(db, collection_name):
+    """
+    Look up the ID of a collection by name.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection_name: Name of the collection
+
+    Returns:
+        The collection ID, or None if the collection (or the collections
+        table) does not exist
+    """
+    # Ids found through this database before; delete_collection clears them
+    cache = db.__dict__.setdefault("_kaze_collection_ids", {})
+    if collection_name in cache:
+        return cache[collection_name]
+
+    try:
+        row = db.execute(
+            "SELECT id FROM collections WHERE name = ? LIMIT 1", [collection_name]
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # The collections table is created with the first collection
+        return None
+    if row is None:
+        # Misses aren't cached, so a collection created later is found
+        return None
+    cache[collection_name] = row[0]
+    return row[0]
+
+
+def get_collection_counts(db):
+    """
+    Count the entries in every collection with a single query.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+
+    Returns:
+        List of (collection name, entry count) tuples in creation order
+    """
+    try:
+        return db.execute(
+            """
+            SELECT collections.name, COUNT(embeddings.id)
+            FROM collections
+            LEFT JOIN embeddings ON embeddings.collection_id = collections.id
+            GROUP BY collections.id
+            ORDER BY collections.id
+            """
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # No collections (or embeddings) table yet
+        return []
+
+
 def show_collections(db_path):
     """Lists the collections in the database."""
     try:
         # Connect to the database
-        db = sqlite_utils.Database(db_path)
+        db = get_db(db_path, read_only=True)
 
-        # Get collections
-        collections = list_collections(db)
+        # Get collections with their counts in one query
+        collection_counts = get_collection_counts(db)
 
-        if not collections:
+        if not collection_counts:
             print("   [yellow]No collections found[/yellow]")
         else:
-            for collection in collections:
-                try:
-                    # Get the collection
-                    coll = llm.Collection(collection, db)
-                    count = coll.count()
-                    print(
-                        f"   - [cyan]{collection}[/cyan]: [yellow]{count}[/yellow] files"
-                    )
-                except Exception as e:
-                    print(
-                        f"   - [cyan]{collection}[/cyan]: [red]Error getting count: {str(e)}[/red]"
-                    )
+            for collection, count in collection_counts:
+                print(f"   - [cyan]{collection}[/cyan]: [yellow]{count}[/yellow] files")
     except Exception as e:
         print(f"[red]Error listing collections: {str(e)}[/red]")
 
 
 def get_collection_count(db_path, collection_name):
-    """Gets the number of entries in a collection using the Collection class."""
+    """Gets the number of entries in a collection."""
     try:
         # Connect to the database
-        db = sqlite_utils.Database(db_path)
+        db = get_db(db_path, read_only=True)
 
         # Check if collection exists
-        if not llm.Collection.exists(db, collection_name):
+        collection_id = get_collection_id(db, collection_name)
+        if collection_id is None:
             return 0
 
-        # Get the collection and count
-        collection = llm.Collection(collection_name, db)
-        return collection.count()
+        return db.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE collection_id = ?", [collection_id]
+        ).fetchone()[0]
     except Exception as e:
         print(f"[red]Error getting collection count: {str(e)}[/red]")
         return 0
@@ -125,61 +352,667 @@ def get_collection_model(db_path, collection_name):
     """Gets the embedding model used for a collection."""
     try:
         # Connect to the database
-        db = sqlite_utils.Database(db_path)
-
-        # Check if collection exists
-        if not llm.Collection.exists(db, collection_name):
-            return None
+        db = get_db(db_path, read_only=True)
 
-        # Get the collection
-        collection = llm.Collection(collection_name, db)
-        return collection.model_id
+        # Read the model straight from the collection's row
+        row = db.execute(
+            "SELECT model FROM collections WHERE name = ?", [collection_name]
+        ).fetchone()
+        return row[0] if row else None
     except Exception as e:
         print(f"[red]Error getting collection model: {str(e)}[/red]")
         return None
 
 
-def find_most_similar(db_path, collection_name, query_text, limit=1):
+# Query vectors kept in query_cache; older entries are dropped first
+QUERY_CACHE_SIZE = 1000
+
+
+def embed_query(db, collection, query_text):
+    """
+    Embed query text with the collection's model, reusing cached vectors.
+
+    Query vectors are kept in a query_cache table keyed by model and a hash
+    of the text, so running the same query again skips the round trip to
+    the embedding model. Only the QUERY_CACHE_SIZE most recently added
+    queries are kept. On a read-only connection the cache is only read.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection: The llm.Collection being searched
+        query_text: Text to embed
+
+    Returns:
+        The query vector as a sequence of floats
+    """
+    import llm
+
+    text_hash = hashlib.sha1(query_text.encode("utf-8")).hexdigest()
+    try:
+        row = db.execute(
+            "SELECT embedding FROM query_cache WHERE model_id = ? AND text_hash = ?",
+            [collection.model_id, text_hash],
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # No cache table yet
+        row = None
+    if row:
+        return llm.decode(row[0])
+
+    vector = collection.model().embed(query_text)
+    if db.execute("PRAGMA query_only").fetchone()[0]:
+        return vector
+    try:
+        with db.conn:
+            db.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    model_id TEXT,
+                    text_hash TEXT,
+                    embedding BLOB,
+                    PRIMARY KEY (model_id, text_hash)
+                )
+                """
+            )
+            db.conn.execute(
+                "INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?)",
+                [collection.model_id, text_hash, llm.encode(vector)],
+            )
+            # New rows take the next rowid, so the lowest rowids are the
+            # oldest entries
+            db.conn.execute(
+                "DELETE FROM query_cache WHERE rowid <= "
+                "(SELECT max(rowid) FROM query_cache) - ?",
+                [QUERY_CACHE_SIZE],
+            )
+    except sqlite3.OperationalError:
+        # Locked or unwritable database; the query still works, just uncached
+        pass
+    return vector
+
+
+def similar_by_vector(db, collection_id, query_vector, number=10, threshold=None):
+    """
+    Rank a collection's stored embeddings by cosine similarity to a vector.
+
+    Does the same scan as llm's Collection.similar_by_vector, with a
+    faster scoring function: the blob is unpacked with a precompiled
+    struct, the query is normalized once instead of per row, and the
+    dot products avoid Python-level generator loops.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection_id: ID of the collection to search
+        query_vector: The embedded query, as a sequence of floats
+        number: Maximum number of results to return
+        threshold: Minimum similarity score for a result, if any
+
+    Returns:
+        List of {"id", "score", "content", "metadata"} dicts, best first
+    """
+    query_vector = tuple(query_vector)
+    cosine_score = _cosine_scorer(query_vector, threshold)
+    if cosine_score is None:
+        return []
+
+    if has_vector_index(db, collection_id) and load_vector_extension(db):
+        try:
+            return _similar_by_vector_index(
+                db, collection_id, query_vector, number, threshold
+            )
+        except sqlite3.OperationalError:
+            # e.g. a query vector from a model with other dimensions
+            pass
+
+    db.conn.create_function("kaze_cosine_score", 1, cosine_score, deterministic=True)
+
+    rows = db.execute(
+        """
+        SELECT id, content, metadata, kaze_cosine_score(embedding) AS score
+        FROM embeddings
+        WHERE collection_id = ?
+        ORDER BY score DESC
+        LIMIT ?
+        """,
+        [collection_id, number],
+    )
+    return [
+        {
+            "id": id_,
+            "score": score,
+            "content": content,  # Will be None if not stored
+            "metadata": json_loads(metadata) if metadata else None,
+        }
+        for id_, content, metadata, score in rows
+        # NULL scores (mismatched dimensions, under the threshold) sort last
+        if score is not None
+    ]
+
+
+def _cosine_scorer(query_vector, threshold=None):
+    """
+    Build the function that scores a stored embedding blob against a query.
+
+    Returns None for a zero query vector, which nothing can be compared to.
+    """
+    unpack = struct.Struct("<%df" % len(query_vector)).unpack
+    blob_size = 4 * len(query_vector)
+
+    query_norm = math.sqrt(_dot(query_vector, query_vector))
+    if not query_norm:
+        return None
+    # Normalize the query once so each row only divides by its own norm
+    query_vector = tuple(value / query_norm for value in query_vector)
+
+    def cosine_score(blob):
+        # Vectors from a model with different dimensions can't be compared
+        if len(blob) != blob_size:
+            return None
+        vector = unpack(blob)
+        norm = math.sqrt(_dot(vector, vector))
+        if not norm:
+            return None
+        score = _dot(vector, query_vector) / norm
+        # Rows under the threshold score NULL, so they never take one of
+        # the LIMIT slots from a row that passes
+        if threshold is not None and score < threshold:
+            return None
+        return score
+
+    return cosine_score
+
+
+def score_embeddings(db, collection_id, query_vector, ids, threshold=None):
+    """
+    Score specific entries of a collection against a query vector.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection_id: ID of the collection the entries belong to
+        query_vector: The embedded query, as a sequence of floats
+        ids: IDs of the entries to score
+        threshold: Minimum similarity score (optional)
+
+    Returns:
+        Dictionary of id to cosine similarity, for the entries that have
+        a comparable embedding scoring at least the threshold
+    """
+    cosine_score = _cosine_scorer(tuple(query_vector), threshold)
+    if cosine_score is None or not ids:
+        return {}
+
+    placeholders = ", ".join("?" * len(ids))
+    rows = db.execute(
+        f"SELECT id, embedding FROM embeddings WHERE collection_id = ? AND id IN ({placeholders})",
+        [collection_id, *ids],
+    )
+    scores = {id_: cosine_score(embedding) for id_, embedding in rows}
+    return {id_: score for id_, score in scores.items() if score is not None}
+
+
+def _similar_by_vector_index(db, collection_id, query_vector, number, threshold):
+    """similar_by_vector, answered from the collection's vec0 index."""
+    # `k = ?` rather than LIMIT: vec0 only takes a KNN LIMIT on SQLite 3.41+
+    rows = db.execute(
+        f"""
+        SELECT e.id, e.content, e.metadata, 1 - v.distance AS score
+        FROM (
+            SELECT id, distance FROM {_vector_index_name(collection_id)}
+            WHERE embedding MATCH ? AND k = ?
+        ) AS v
+        JOIN embeddings AS e ON e.collection_id = ? AND e.id = v.id
+        ORDER BY v.distance
+        """,
+        [
+            struct.pack("<%df" % len(query_vector), *query_vector),
+            number,
+            collection_id,
+        ],
+    )
+    return [
+        {
+            "id": id_,
+            "score": score,
+            "content": content,  # Will be None if not stored
+            "metadata": json_loads(metadata) if metadata else None,
+        }
+        for id_, content, metadata, score in rows
+        if threshold is None or score >= threshold
+    ]
+
+
+def _vector_index_name(collection_id):
+    return f"embeddings_vec_{int(collection_id)}"
+
+
+def load_vector_extension(db):
+    """
+    Load sqlite-vec into the database connection, once per connection.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+
+    Returns:
+        True if the extension is loaded, False if sqlite-vec isn't installed
+        or this Python's sqlite3 can't load extensions
+    """
+    if sqlite_vec is None:
+        return False
+    if db.__dict__.get("_kaze_vec_loaded"):
+        return True
+    try:
+        db.conn.enable_load_extension(True)
+        sqlite_vec.load(db.conn)
+        db.conn.enable_load_extension(False)
+    except (AttributeError, sqlite3.OperationalError):
+        return False
+    db.__dict__["_kaze_vec_loaded"] = True
+    return True
+
+
+def has_vector_index(db, collection_id):
+    """Return True if the collection has a sqlite-vec index."""
+    row = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        [_vector_index_name(collection_id)],
+    ).fetchone()
+    return row is not None
+
+
+def create_vector_index(db, collection_id):
+    """
+    Build, or rebuild, a sqlite-vec index over a collection's embeddings.
+
+    The vec0 table is keyed on the embedding id, not the embeddings rowid,
+    which INSERT OR REPLACE and VACUUM can renumber, and stores the same
+    float32 blobs, so it is filled with a single INSERT ... SELECT. It is
+    a snapshot: rebuild it after the collection's embeddings change.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection_id: ID of the collection to index
+
+    Returns:
+        True if the index was built, False if sqlite-vec is unavailable or
+        the collection has no embeddings
+    """
+    if not load_vector_extension(db):
+        return False
+
+    row = db.execute(
+        "SELECT length(embedding) FROM embeddings WHERE collection_id = ? LIMIT 1",
+        [collection_id],
+    ).fetchone()
+    if row is None:
+        return False
+    blob_size = row[0]
+    name = _vector_index_name(collection_id)
+
+    conn = db.conn
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+        conn.execute(
+            f"CREATE VIRTUAL TABLE {name} USING "
+            f"vec0(id text primary key, "
+            f"embedding float[{blob_size // 4}] distance_metric=cosine)"
+        )
+        conn.execute(
+            f"""
+            INSERT INTO {name}(id, embedding)
+            SELECT id, embedding FROM embeddings
+            WHERE collection_id = ? AND length(embedding) = ?
+            """,
+            [collection_id, blob_size],
+        )
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return True
+
+
+def build_vector_index(db, collection_name):
+    """Build the sqlite-vec index for a collection and report the outcome."""
+    collection_id = get_collection_id(db, collection_name)
+    if collection_id is not None and create_vector_index(db, collection_id):
+        print(f"[green]🧭 Built vector index for collection '{collection_name}'[/green]")
+    else:
+        print(
+            "[yellow]⚠️ Could not build a vector index - is sqlite-vec installed?[/yellow]"
+        )
+
+
+def drop_vector_index(db, collection_id):
+    """Drop a collection's sqlite-vec index, if it has one."""
+    if not has_vector_index(db, collection_id):
+        return
+    # Dropping a vec0 table needs the module loaded
+    if not load_vector_extension(db):
+        print(
+            "[yellow]⚠️ sqlite-vec is not installed; "
+            f"left the stale {_vector_index_name(collection_id)} index in place[/yellow]"
+        )
+        return
+    db.execute(f"DROP TABLE {_vector_index_name(collection_id)}")
+    db.conn.commit()
+
+
+def find_most_similar(db, collection_name, query_text, limit=1):
     """Finds the single most similar document to the query text."""
-    results = query_embeddings(db_path, collection_name, query_text, limit, 0.0)
+    results = query_embeddings(db, collection_name, query_text, limit, 0.0)
     return results[0] if results else None
 
 
 # NEW FUNCTIONS FOR CHUNKS
-def setup_chunk_tables(db_path):
-    """Set up database tables for storing code chunks."""
+def create_chunk_indexes(db):
+    """
+    Create the indexes used by the chunk lookups.
+
+    The composite indexes lead with collection_id since every chunk query
+    in the CLI is scoped to a single collection.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+    """
+    db.conn.executescript(
+        """
+        CREATE INDEX IF NOT EXISTS chunks_parent_id ON chunks(parent_id);
+        CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path);
+        CREATE INDEX IF NOT EXISTS chunks_type ON chunks(type);
+        CREATE INDEX IF NOT EXISTS idx_chunks_coll_parent ON chunks(collection_id, parent_id);
+        CREATE INDEX IF NOT EXISTS idx_chunks_coll_type ON chunks(collection_id, type);
+        CREATE INDEX IF NOT EXISTS idx_chunks_coll_path ON chunks(collection_id, path);
+        """
+    )
+    create_chunk_path_index(db)
+    create_chunk_text_index(db)
+
+
+def has_chunk_path_index(db):
+    """Return True if the trigram path index exists in this database."""
+    row = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_path_fts'"
+    ).fetchone()
+    return row is not None
+
+
+def _drop_fts_index(db, table):
+    """Drop an FTS5 chunk index and its three sync triggers in one transaction."""
+    db.conn.executescript(
+        f"""
+        BEGIN IMMEDIATE;
+        DROP TRIGGER IF EXISTS {table}_insert;
+        DROP TRIGGER IF EXISTS {table}_delete;
+        DROP TRIGGER IF EXISTS {table}_update;
+        DROP TABLE IF EXISTS {table};
+        COMMIT;
+        """
+    )
+
+
+def _has_current_fts_triggers(db, table):
+    """
+    Return True if an FTS5 chunk index has this version's sync triggers.
+
+    Older triggers wrote with INSERT OR REPLACE, which the upsert in
+    bulk_insert_chunks overrides to ABORT, and left orphaned entries behind
+    from the INSERT OR REPLACE writes the chunks table used to get.
+    """
+    row = db.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+        [f"{table}_update"],
+    ).fetchone()
+    return row is not None and "INSERT OR REPLACE" not in row[0]
+
+
+def create_chunk_path_index(db):
+    """
+    Create the FTS5 trigram index used for substring matching on chunk paths.
+
+    A B-tree index can't serve `path LIKE '%foo%'`, so `kaze chunks list --file`
+    matches against this table instead. Triggers keep it in sync with the
+    chunks table, keyed on the chunk rowid. Older SQLite builds without the
+    trigram tokenizer (< 3.34) simply skip it and fall back to LIKE.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+    """
+    if has_chunk_path_index(db):
+        if _has_current_fts_triggers(db, "chunks_path_fts"):
+            return
+        # Built by an older version; rebuild it to drop any orphaned entries
+        _drop_fts_index(db, "chunks_path_fts")
+
     try:
-        # Connect to the database
-        db = sqlite_utils.Database(db_path)
+        with db.conn:
+            db.conn.executescript(
+                """
+                CREATE VIRTUAL TABLE chunks_path_fts USING fts5(path, tokenize='trigram');
+                -- bulk_insert_chunks upserts, so a re-chunked row keeps its
+                -- rowid and goes through the update trigger. Entries are
+                -- deleted and inserted rather than written with INSERT OR
+                -- REPLACE, which the upsert's conflict policy would override.
+                CREATE TRIGGER IF NOT EXISTS chunks_path_fts_insert AFTER INSERT ON chunks BEGIN
+                    DELETE FROM chunks_path_fts WHERE rowid = new.rowid;
+                    INSERT INTO chunks_path_fts(rowid, path) VALUES (new.rowid, new.path);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_path_fts_delete AFTER DELETE ON chunks BEGIN
+                    DELETE FROM chunks_path_fts WHERE rowid = old.rowid;
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_path_fts_update AFTER UPDATE OF path ON chunks BEGIN
+                    DELETE FROM chunks_path_fts WHERE rowid = old.rowid;
+                    INSERT INTO chunks_path_fts(rowid, path) VALUES (new.rowid, new.path);
+                END;
+                INSERT INTO chunks_path_fts(rowid, path) SELECT rowid, path FROM chunks;
+                """
+            )
+    except sqlite3.OperationalError:
+        # No FTS5 or no trigram tokenizer in this SQLite build
+        pass
 
-        # Create the chunks table if it doesn't exist
-        db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS chunks (
-                id TEXT PRIMARY KEY,
-                collection_id INTEGER,
-                type TEXT,
-                name TEXT,
-                path TEXT,
-                start_line INTEGER,
-                start_col INTEGER,
-                end_line INTEGER,
-                end_col INTEGER,
-                parent_id TEXT,
-                content TEXT,
-                metadata TEXT,
-                updated INTEGER,
-                FOREIGN KEY (collection_id) REFERENCES collections(id)
+
+# Database files whose chunk tables and indexes are known to exist
+_SCHEMA_READY = set()
+
+
+def create_chunk_tables(db):
+    """
+    Create the chunks table and its indexes, once per database file.
+
+    Chunk batches are stored through a new connection each time, so the
+    file path rather than the connection records that the schema is done,
+    sparing every later batch the CREATE ... IF NOT EXISTS round-trips.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+    """
+    # The main database's file path, the same for every connection to it
+    db_file = db.execute("PRAGMA database_list").fetchone()[2]
+    if db_file and db_file in _SCHEMA_READY:
+        return
+
+    # Create the chunks table if it doesn't exist
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chunks (
+            id TEXT PRIMARY KEY,
+            collection_id INTEGER,
+            type TEXT,
+            name TEXT,
+            path TEXT,
+            start_line INTEGER,
+            start_col INTEGER,
+            end_line INTEGER,
+            end_col INTEGER,
+            parent_id TEXT,
+            content TEXT,
+            metadata TEXT,
+            updated INTEGER,
+            FOREIGN KEY (collection_id) REFERENCES collections(id)
+        )
+        """
+    )
+
+    # Create indexes
+    create_chunk_indexes(db)
+
+    if db_file:
+        _SCHEMA_READY.add(db_file)
+
+
+def has_chunk_text_index(db):
+    """Return True if the full-text chunk index exists in this database."""
+    row = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'"
+    ).fetchone()
+    return row is not None
+
+
+def create_chunk_text_index(db):
+    """
+    Create the FTS5 index used for keyword matching on chunk text.
+
+    Hybrid `kaze chunks query` ranks chunks by BM25 over their name, path
+    and content alongside vector similarity. Triggers keep the index in
+    sync with the chunks table, keyed on the chunk rowid like the path
+    index. SQLite builds without FTS5 skip it, and hybrid queries fall
+    back to vector similarity alone.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+    """
+    if has_chunk_text_index(db):
+        if _has_current_fts_triggers(db, "chunks_fts"):
+            return
+        # Built by an older version; rebuild it to drop any orphaned entries
+        _drop_fts_index(db, "chunks_fts")
+
+    try:
+        with db.conn:
+            db.conn.executescript(
+                """
+                CREATE VIRTUAL TABLE chunks_fts USING fts5(name, path, content);
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                    DELETE FROM chunks_fts WHERE rowid = new.rowid;
+                    INSERT INTO chunks_fts(rowid, name, path, content)
+                    VALUES (new.rowid, new.name, new.path, new.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                    DELETE FROM chunks_fts WHERE rowid = old.rowid;
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE ON chunks BEGIN
+                    DELETE FROM chunks_fts WHERE rowid = old.rowid;
+                    INSERT INTO chunks_fts(rowid, name, path, content)
+                    VALUES (new.rowid, new.name, new.path, new.content);
+                END;
+                INSERT INTO chunks_fts(rowid, name, path, content)
+                SELECT rowid, name, path, content FROM chunks;
+                """
             )
+    except sqlite3.OperationalError:
+        # No FTS5 in this SQLite build
+        pass
+
+
+def drop_chunk_search_indexes(db):
+    """
+    Drop the FTS5 path and text indexes along with their sync triggers.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+    """
+    _drop_fts_index(db, "chunks_path_fts")
+    _drop_fts_index(db, "chunks_fts")
+
+
+@contextlib.contextmanager
+def deferred_chunk_search_indexes(db, collection_name):
+    """
+    Leave the FTS5 chunk indexes out of a bulk ingest and rebuild them after.
+
+    With the indexes in place every stored chunk also fires the sync
+    triggers, which re-tokenize its path and content row by row. Dropping
+    them for the ingest and backfilling once at the end is much cheaper,
+    but the backfill covers every collection's chunks, so the indexes are
+    only deferred while the chunks table holds no other collection's rows;
+    otherwise the triggers stay and only the new rows are indexed.
+
+    The rebuild runs even if the ingest fails; if the process dies first,
+    the next create_chunk_tables call in a new process rebuilds them, and
+    until then queries fall back to LIKE and vector-only ranking.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection_name: Name of the collection being ingested
+    """
+    # Mark the schema as ready first, so the chunk stores made during the
+    # ingest don't put the indexes straight back
+    create_chunk_tables(db)
+
+    other_rows = db.execute(
+        "SELECT 1 FROM chunks WHERE collection_id IS NOT ? LIMIT 1",
+        [get_collection_id(db, collection_name)],
+    ).fetchone()
+    if other_rows:
+        yield
+        return
+
+    drop_chunk_search_indexes(db)
+    try:
+        yield
+    finally:
+        create_chunk_path_index(db)
+        create_chunk_text_index(db)
+
+
+def search_chunk_text(db, collection_id, query_text, limit):
+    """
+    Rank a collection's chunks by BM25 keyword relevance to a query.
+
+    Each word of the query is matched on its own, so identifiers and file
+    names in the query find chunks that mention them.
+
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection_id: ID of the collection to search
+        query_text: Text to search for
+        limit: Maximum number of chunk IDs to return
+
+    Returns:
+        List of chunk IDs, most relevant first; empty when the database
+        has no full-text index
+    """
+    words = re.findall(r"\w+", query_text)
+    if not words or not has_chunk_text_index(db):
+        return []
+
+    match = " OR ".join(f'"{word}"' for word in words)
+    try:
+        rows = db.execute(
             """
+            SELECT chunks.id FROM chunks_fts
+            JOIN chunks ON chunks.rowid = chunks_fts.rowid
+            WHERE chunks_fts MATCH ? AND chunks.collection_id = ?
+            ORDER BY bm25(chunks_fts)
+            LIMIT ?
+            """,
+            [match, collection_id, limit],
         )
+        return [row[0] for row in rows]
+    except sqlite3.OperationalError:
+        return []
 
-        # Create indexes
-        db.execute("CREATE INDEX IF NOT EXISTS chunks_parent_id ON chunks(parent_id)")
-        db.execute("CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path)")
-        db.execute("CREATE INDEX IF NOT EXISTS chunks_type ON chunks(type)")
 
-        print(f"[green]✓ Set up chunk tables in {db_path}[/green]")
+def setup_chunk_tables(db_path):
+    """Set up database tables for storing code chunks."""
+    try:
+        # Connect to the database
+        db = get_db(db_path)
+
+        create_chunk_tables(db)
+
+        logger.debug("Set up chunk tables in %s", db_path)
         return True
     except Exception as e:
         print(f"[red]❌ Error setting up chunk tables: {str(e)}[/red]")
@@ -190,67 +1023,106 @@ def store_chunks(db_path, collection_name, chunks):
     """Store code chunks in the database."""
     try:
         # Connect to the database
-        db = sqlite_utils.Database(db_path)
+        db = get_db(db_path)
+    except Exception as e:
+        print(f"[red]❌ Error storing chunks: {str(e)}[/red]")
+        return False
 
-        # Check if collection exists
-        if not llm.Collection.exists(db, collection_name):
-            print(
-                f"[red]Collection '{collection_name}' does not exist in the database[/red]"
-            )
-            return False
+    # Same checks, schema setup and single-transaction executemany as the
+    # connection-sharing variant
+    return store_chunks_with_db(db, collection_name, chunks)
 
-        # Get the collection ID
-        collection_rows = list(
-            db.query("SELECT id FROM collections WHERE name = ?", [collection_name])
-        )
-        if not collection_rows:
-            print(f"[red]Collection '{collection_name}' not found in database[/red]")
-            return False
 
-        collection_id = collection_rows[0]["id"]
+# Reciprocal rank fusion constant; 60 is the value from the original paper
+RRF_K = 60
 
-        # Set up the chunk tables
-        setup_chunk_tables(db_path)
 
-        # Prepare chunks for insertion
-        import json
-        import time
+def fuse_rankings(db, collection_id, query_vector, scores, keyword_ids, threshold=None):
+    """
+    Merge vector and keyword rankings with reciprocal rank fusion.
 
-        now = int(time.time())
+    Each chunk gets 1 / (RRF_K + rank) from every list it appears in, and
+    the chunks are reordered by the sum. Keyword-only matches are scored
+    against the query vector so every result still carries a similarity,
+    and are dropped when it falls below the threshold like any other chunk.
 
-        # Insert chunks one by one (not the most efficient, but most compatible)
-        for chunk in chunks:
-            db.execute(
-                """
-                INSERT OR REPLACE INTO chunks 
-                (id, collection_id, type, name, path, start_line, start_col, 
-                end_line, end_col, parent_id, content, metadata, updated)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                [
-                    chunk["id"],
-                    collection_id,
-                    chunk["type"],
-                    chunk["name"],
-                    chunk["path"],
-                    chunk["start_line"],
-                    chunk["start_col"],
-                    chunk["end_line"],
-                    chunk["end_col"],
-                    chunk.get("parent_id"),
-                    chunk["content"],
-                    json.dumps(chunk.get("metadata", {})),
-                    now,
-                ],
-            )
+    Args:
+        db: A sqlite_utils.Database instance with an active connection
+        collection_id: ID of the collection searched
+        query_vector: The embedded query, as a sequence of floats
+        scores: Mapping of chunk id to similarity score, best first
+        keyword_ids: Chunk IDs from search_chunk_text, best first
+        threshold: Minimum similarity score for keyword-only matches
 
-        print(
-            f"[green]✓ Stored {len(chunks)} chunks in collection '{collection_name}'[/green]"
-        )
-        return True
-    except Exception as e:
-        print(f"[red]❌ Error storing chunks: {str(e)}[/red]")
-        return False
+    Returns:
+        Mapping of chunk id to similarity score, in fused order
+    """
+    if not keyword_ids:
+        return scores
+
+    missing = [chunk_id for chunk_id in keyword_ids if chunk_id not in scores]
+    similarity = {
+        **score_embeddings(db, collection_id, query_vector, missing, threshold),
+        **scores,
+    }
+
+    fused = {}
+    for ranking in (scores, keyword_ids):
+        for rank, chunk_id in enumerate(ranking, 1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1 / (RRF_K + rank)
+
+    return {
+        chunk_id: similarity[chunk_id]
+        for chunk_id in sorted(fused, key=fused.get, reverse=True)
+        if chunk_id in similarity
+    }
+
+
+# Columns of the chunks table, in the order the chunk queries select them
+CHUNK_COLUMNS = (
+    "id",
+    "collection_id",
+    "type",
+    "name",
+    "path",
+    "start_line",
+    "start_col",
+    "end_line",
+    "end_col",
+    "parent_id",
+    "content",
+    "metadata",
+    "updated",
+)
+_CHUNK_SELECT = ", ".join(CHUNK_COLUMNS)
+_METADATA_INDEX = CHUNK_COLUMNS.index("metadata")
+
+
+def _chunk_dict(row, **extra):
+    """Build a chunk result dict from a row tuple in CHUNK_COLUMNS order."""
+    return dict(
+        zip(CHUNK_COLUMNS, row), metadata=LazyJSON(row[_METADATA_INDEX]), **extra
+    )
+
+
+def _iter_chunk_results(scores, chunk_rows):
+    """
+    Yield query_chunks results lazily, in score order.
+
+    Args:
+        scores: Mapping of chunk id to similarity score, in result order
+        chunk_rows: Mapping of chunk id to its row tuple in CHUNK_COLUMNS
+            order; ids the filters excluded are missing
+
+    Yields:
+        Chunk row dicts with "score" added and "metadata" wrapped in LazyJSON
+    """
+    for chunk_id, score in scores.items():
+        row = chunk_rows.get(chunk_id)
+        if row is None:
+            continue
+
+        yield _chunk_dict(row, score=score)
 
 
 def query_chunks(
@@ -261,73 +1133,65 @@ def query_chunks(
     threshold,
     chunk_type=None,
     parent_id=None,
+    hybrid=False,
 ):
-    """Query for similar chunks."""
+    """
+    Query for similar chunks.
+
+    With hybrid set, chunks matching the query's words (BM25 over the
+    full-text index) are merged with the vector matches by reciprocal
+    rank fusion, so exact identifiers and file names rank well even when
+    their embeddings don't.
+    """
     try:
         # Connect to the database
-        db = sqlite_utils.Database(db_path)
+        db = get_db(db_path)
 
-        # Check if collection exists
-        if not llm.Collection.exists(db, collection_name):
+        # Check if collection exists, resolving its id once for every hit below
+        collection_id = get_collection_id(db, collection_name)
+        if collection_id is None:
             print(
                 f"[red]Collection '{collection_name}' does not exist in the database[/red]"
             )
             return []
 
-        # Get the collection
+        # Embed the query with the collection's model
+        import llm
+
         collection = llm.Collection(collection_name, db)
+        query_vector = embed_query(db, collection, query_text)
 
-        # Query for similar documents
-        results = collection.similar(
-            query_text, number=limit * 2
+        # Query for similar documents over the threshold
+        results = similar_by_vector(
+            db, collection_id, query_vector, limit * 2, threshold
         )  # Get more to allow for filtering
 
-        # Filter by threshold and convert to serializable dictionaries
-        serializable_results = []
-
-        for entry in results:
-            if entry.score < threshold:
-                continue
-
-            # Get the chunk from the chunks table
-            try:
-                chunk_rows = list(
-                    db.query(
-                        "SELECT * FROM chunks WHERE id = ? AND collection_id = (SELECT id FROM collections WHERE name = ?)",
-                        [entry.id, collection_name],
-                    )
-                )
-
-                if not chunk_rows:
-                    continue
-
-                chunk_row = chunk_rows[0]
-
-                # Apply filters
-                if chunk_type and chunk_row["type"] != chunk_type:
-                    continue
-
-                if parent_id is not None and chunk_row["parent_id"] != parent_id:
-                    continue
-
-                # Convert to dictionary
-                import json
-
-                result_dict = dict(chunk_row)
-                result_dict["score"] = entry.score
-                result_dict["metadata"] = json.loads(result_dict["metadata"])
-
-                serializable_results.append(result_dict)
-
-                # Stop if we've reached the limit
-                if len(serializable_results) >= limit:
-                    break
-            except Exception as inner_e:
-                print(
-                    f"[yellow]⚠️ Error processing chunk {entry.id}: {str(inner_e)}[/yellow]"
-                )
+        # Keep the similarity order
+        scores = {entry["id"]: entry["score"] for entry in results}
+        if hybrid:
+            keyword_ids = search_chunk_text(db, collection_id, query_text, limit * 2)
+            scores = fuse_rankings(
+                db, collection_id, query_vector, scores, keyword_ids, threshold
+            )
+        if not scores:
+            return []
 
-        return serializable_results
+        # Fetch every candidate chunk in one query, letting SQLite drop the
+        # ones the type and parent filters exclude
+        placeholders = ", ".join("?" * len(scores))
+        sql = f"SELECT {_CHUNK_SELECT} FROM chunks WHERE collection_id = ? AND id IN ({placeholders})"
+        params = [collection_id, *scores]
+        if chunk_type:
+            sql += " AND type = ?"
+            params.append(chunk_type)
+        if parent_id is not None:
+            sql += " AND parent_id = ?"
+            params.append(parent_id)
+        # Raw tuples keyed by id; dicts are only built for returned results
+        chunk_rows = {row[0]: row for row in db.execute(sql, params)}
+
+        # Convert to serializable dictionaries, best match first
+        return list(islice(_iter_chunk_results(scores, chunk_rows), limit))
     except sqlite3.OperationalError as e:
         print(f"[red]Database error: {str(e)}[/red]")
         return []
@@ -340,43 +1204,24 @@ def get_chunks_by_path(db_path, collection_name, file_path):
     """Get all chunks for a specific file path."""
     try:
         # Connect to the database
-        db = sqlite_utils.Database(db_path)
+        db = get_db(db_path, read_only=True)
 
         # Check if collection exists
-        if not llm.Collection.exists(db, collection_name):
+        collection_id = get_collection_id(db, collection_name)
+        if collection_id is None:
             print(
                 f"[red]Collection '{collection_name}' does not exist in the database[/red]"
             )
             return []
 
-        # Get the collection ID
-        collection_rows = list(
-            db.query("SELECT id FROM collections WHERE name = ?", [collection_name])
-        )
-        if not collection_rows:
-            print(f"[red]Collection '{collection_name}' not found in database[/red]")
-            return []
-
-        collection_id = collection_rows[0]["id"]
-
         # Query for chunks by path
-        import json
-
-        chunk_rows = list(
-            db.query(
-                "SELECT * FROM chunks WHERE path = ? AND collection_id = ?",
-                [file_path, collection_id],
-            )
+        rows = db.execute(
+            f"SELECT {_CHUNK_SELECT} FROM chunks WHERE path = ? AND collection_id = ?",
+            [file_path, collection_id],
         )
 
-        # Convert to dictionaries
-        chunks = []
-        for row in chunk_rows:
-            chunk_dict = dict(row)
-            chunk_dict["metadata"] = json.loads(chunk_dict["metadata"])
-            chunks.append(chunk_dict)
-
-        return chunks
+        # Convert every row to a dictionary in one pass over the raw tuples
+        return [_chunk_dict(row) for row in rows]
     except Exception as e:
         print(f"[red]Error getting chunks by path: {str(e)}[/red]")
         return []
@@ -386,41 +1231,72 @@ def get_chunk_count(db_path, collection_name):
     """Get the number of chunks in a collection."""
     try:
         # Connect to the database
-        db = sqlite_utils.Database(db_path)
+        db = get_db(db_path, read_only=True)
 
         # Check if collection exists
-        if not llm.Collection.exists(db, collection_name):
+        collection_id = get_collection_id(db, collection_name)
+        if collection_id is None:
             print(
                 f"[red]Collection '{collection_name}' does not exist in the database[/red]"
             )
             return 0
 
-        # Get the collection ID
-        collection_rows = list(
-            db.query("SELECT id FROM collections WHERE name = ?", [collection_name])
-        )
-        if not collection_rows:
-            print(f"[red]Collection '{collection_name}' not found in database[/red]")
-            return 0
-
-        collection_id = collection_rows[0]["id"]
-
         # Count chunks
-        count_rows = list(
-            db.query(
-                "SELECT COUNT(*) as count FROM chunks WHERE collection_id = ?",
-                [collection_id],
-            )
-        )
-
-        count = count_rows[0]["count"] if count_rows else 0
-
-        return count
+        return db.execute(
+            "SELECT COUNT(*) FROM chunks WHERE collection_id = ?", [collection_id]
+        ).fetchone()[0]
     except Exception as e:
         print(f"[red]Error getting chunk count: {str(e)}[/red]")
         return 0
 
 
+def bulk_insert_chunks(conn, rows):
+    """
+    Insert chunk rows with one executemany inside a single transaction.
+
+    Existing chunks are updated in place rather than replaced: INSERT OR
+    REPLACE deletes the old row without firing DELETE triggers and inserts
+    under a new rowid, which would leave the old row's entries orphaned in
+    the full-text indexes. The transaction is opened with BEGIN IMMEDIATE so the write lock is
+    taken up front, rather than upgraded mid-transaction where it can fail
+    with SQLITE_BUSY.
+
+    Args:
+        conn: A sqlite3.Connection with no open transaction
+        rows: Iterable of tuples in chunks column order (id, collection_id,
+            type, name, path, start_line, start_col, end_line, end_col,
+            parent_id, content, metadata, updated)
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            """
+            INSERT INTO chunks
+            (id, collection_id, type, name, path, start_line, start_col,
+            end_line, end_col, parent_id, content, metadata, updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                collection_id = excluded.collection_id,
+                type = excluded.type,
+                name = excluded.name,
+                path = excluded.path,
+                start_line = excluded.start_line,
+                start_col = excluded.start_col,
+                end_line = excluded.end_line,
+                end_col = excluded.end_col,
+                parent_id = excluded.parent_id,
+                content = excluded.content,
+                metadata = excluded.metadata,
+                updated = excluded.updated
+            """,
+            rows,
+        )
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
 def store_chunks_with_db(db, collection_name, chunks):
     """
     Store code chunks using an existing database connection.
@@ -435,87 +1311,42 @@ def store_chunks_with_db(db, collection_name, chunks):
     """
     try:
         # Check if collection exists
-        if not llm.Collection.exists(db, collection_name):
-            print(
-                f"[red]Collection '{collection_name}' does not exist in the database[/red]"
-            )
+        collection_id = get_collection_id(db, collection_name)
+        if collection_id is None:
+            logger.error("Collection '%s' does not exist in the database", collection_name)
             return False
 
-        # Get the collection ID
-        collection_rows = list(
-            db.query("SELECT id FROM collections WHERE name = ?", [collection_name])
-        )
-        if not collection_rows:
-            print(f"[red]Collection '{collection_name}' not found in database[/red]")
-            return False
-
-        collection_id = collection_rows[0]["id"]
-
         # Set up the chunk tables (using the existing db connection)
-        db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS chunks (
-                id TEXT PRIMARY KEY,
-                collection_id INTEGER,
-                type TEXT,
-                name TEXT,
-                path TEXT,
-                start_line INTEGER,
-                start_col INTEGER,
-                end_line INTEGER,
-                end_col INTEGER,
-                parent_id TEXT,
-                content TEXT,
-                metadata TEXT,
-                updated INTEGER,
-                FOREIGN KEY (collection_id) REFERENCES collections(id)
-            )
-            """
-        )
-
-        # Create indexes if they don't exist
-        db.execute("CREATE INDEX IF NOT EXISTS chunks_parent_id ON chunks(parent_id)")
-        db.execute("CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path)")
-        db.execute("CREATE INDEX IF NOT EXISTS chunks_type ON chunks(type)")
+        create_chunk_tables(db)
 
         # Prepare chunks for insertion
-        import json
-        import time
-
         now = int(time.time())
 
-        # Begin transaction for bulk insert
-        with db.conn:  # This ensures proper transaction handling
-            # Insert chunks one by one
-            for chunk in chunks:
-                db.execute(
-                    """
-                    INSERT OR REPLACE INTO chunks 
-                    (id, collection_id, type, name, path, start_line, start_col, 
-                    end_line, end_col, parent_id, content, metadata, updated)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    [
-                        chunk["id"],
-                        collection_id,
-                        chunk["type"],
-                        chunk["name"],
-                        chunk["path"],
-                        chunk["start_line"],
-                        chunk["start_col"],
-                        chunk["end_line"],
-                        chunk["end_col"],
-                        chunk.get("parent_id"),
-                        chunk["content"],
-                        json.dumps(chunk.get("metadata", {})),
-                        now,
-                    ],
-                )
-
-        print(
-            f"[green]✓ Stored {len(chunks)} chunks in collection '{collection_name}'[/green]"
+        rows = (
+            (
+                chunk["id"],
+                collection_id,
+                chunk["type"],
+                chunk["name"],
+                chunk["path"],
+                chunk["start_line"],
+                chunk["start_col"],
+                chunk["end_line"],
+                chunk["end_col"],
+                chunk.get("parent_id"),
+                chunk["content"],
+                json_dumps(chunk["metadata"]) if chunk.get("metadata") else "{}",
+                now,
+            )
+            for chunk in chunks
         )
+
+        # Insert every chunk in a single statement and transaction
+        bulk_insert_chunks(db.conn, rows)
+
+        # Runs once per batch from the embedding workers, so keep it quiet
+        logger.debug("Stored %d chunks in collection '%s'", len(chunks), collection_name)
         return True
     except Exception as e:
-        print(f"[red]❌ Error storing chunks: {str(e)}[/red]")
+        logger.error("Error storing chunks: %s", e)
         return False
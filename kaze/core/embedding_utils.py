@@ -1,36 +1,94 @@
 import llm
+import logging
 import os
 import sqlite_utils
 from rich import print
 import tiktoken
 import asyncio
 import sqlite3
-import contextlib
-from functools import wraps
+import threading
+import time
+from functools import lru_cache, wraps
+from itertools import islice
 
 from kaze.core import treesitter_utils, db_utils
 
-# Connection pool management
-_connection_pool = {}
+# Per-file and per-chunk progress goes to this logger at debug level
+# (shown with `kaze --verbose`); one-off status lines use rich's print
+logger = logging.getLogger(__name__)
 
+# Connection pool management: each thread keeps its own connections and
+# collections, since a sqlite3 connection can't be shared across threads
+_connection_pool = threading.local()
 
-@contextlib.contextmanager
-def get_db_connection(db_path, timeout=20.0):
-    """Get a database connection with proper settings to reduce locking."""
+# Chunks sent to the embedding model per request; matches llm's default
+CHUNK_BATCH_SIZE = 100
+
+# Embedding requests kept in flight at once
+MAX_INFLIGHT = 10
+
+# Token budget for one embedding request; OpenAI rejects requests whose
+# inputs add up to more than 300k tokens
+MAX_BATCH_TOKENS = 250_000
+
+# Token limit for a single input; text-embedding-3 models reject any input
+# over 8191 tokens, which fails the whole request it is part of
+MAX_INPUT_TOKENS = 8191
+
+
+def _connect(db_path, timeout):
+    """Open a database connection with proper settings to reduce locking."""
     conn = sqlite3.connect(db_path, timeout=timeout)
-    try:
-        # Configure SQLite for better concurrency
-        conn.execute(
-            "PRAGMA journal_mode=WAL"
-        )  # Write-Ahead Logging for better concurrency
-        conn.execute("PRAGMA synchronous=NORMAL")  # Balance between safety and speed
-        conn.execute("PRAGMA busy_timeout=10000")  # 10 seconds busy timeout
-        conn.execute("PRAGMA temp_store=MEMORY")  # Store temp tables in memory
-        conn.execute("PRAGMA cache_size=-10000")  # Use larger cache (about 10MB)
-        conn.execute("PRAGMA mmap_size=30000000")  # Memory map for faster access
-        yield conn
-    finally:
-        conn.close()
+    # Configure SQLite for better concurrency
+    conn.execute(
+        "PRAGMA journal_mode=WAL"
+    )  # Write-Ahead Logging for better concurrency
+    conn.execute("PRAGMA synchronous=NORMAL")  # Balance between safety and speed
+    conn.execute("PRAGMA busy_timeout=10000")  # 10 seconds busy timeout
+    conn.execute("PRAGMA temp_store=MEMORY")  # Store temp tables in memory
+    conn.execute("PRAGMA cache_size=-10000")  # Use larger cache (about 10MB)
+    conn.execute("PRAGMA mmap_size=30000000")  # Memory map for faster access
+    return conn
+
+
+@lru_cache(maxsize=8)
+def get_embedding_model(model_name):
+    """
+    Look up an embedding model once per process.
+
+    llm.get_embedding_model asks every plugin for its models and builds
+    fresh instances on each call, so it is too slow to repeat per batch.
+    """
+    return llm.get_embedding_model(model_name)
+
+
+def get_collection(db_path, collection_name, model_name):
+    """
+    Return this thread's llm.Collection for a database, opening it once.
+
+    Embedding batches run on the worker threads of the default executor;
+    each thread reuses one connection and Collection per collection rather
+    than reconnecting and re-reading the collection row for every batch.
+    Lock retries are left to the connection's busy_timeout.
+
+    Args:
+        db_path: Path to the SQLite database
+        collection_name: Name of the collection
+        model_name: Name of the embedding model
+
+    Returns:
+        The llm.Collection, whose .db is the thread's sqlite_utils.Database
+    """
+    collections = _connection_pool.__dict__.setdefault("collections", {})
+    key = (os.path.realpath(db_path), collection_name, model_name)
+    collection = collections.get(key)
+    if collection is None:
+        db = sqlite_utils.Database(_connect(db_path, timeout=30.0))
+        collection = llm.Collection(
+            collection_name, db, model=get_embedding_model(model_name)
+        )
+        collections[key] = collection
+    return collection
 
 
 def with_retry(max_retries=5, initial_delay=1.0, backoff_factor=2.0):
@@ -65,14 +123,39 @@ def with_retry(max_retries=5, initial_delay=1.0, backoff_factor=2.0):
     return decorator
 
 
-async def embed_file(file_path, model_name, db_path, collection_name):
-    """Embed the content of a file using the Collection class approach"""
+def read_text(file_path):
+    """
+    Read a file as UTF-8 text, ignoring undecodable bytes.
+
+    The file is read as bytes and decoded in one pass, so empty files are
+    detected without decoding and no incremental text-mode decoder runs.
+    Line endings are normalized to "\\n" as text mode would.
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if not data:
+        return ""
+    content = data.decode("utf-8", errors="ignore")
+    if b"\r" in data:
+        content = content.replace("\r\n", "\n").replace("\r", "\n")
+    return content
+
+
+async def embed_file(
+    file_path, model_name, db_path, collection_name, count_tokens=False
+):
+    """
+    Embed the content of a file using the Collection class approach.
+
+    The file's tokens are only counted, and stored in its metadata, when
+    count_tokens is set; otherwise the log shows estimate_tokens().
+    """
     try:
         # Calculate the file ID (relative path)
         file_id = os.path.relpath(file_path, os.getcwd())
 
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            content = f.read()
+        # Read in a worker thread so concurrent calls don't block the loop
+        content = await asyncio.to_thread(read_text, file_path)
 
         # Skip empty files
         if not content:
@@ -80,244 +163,432 @@ async def embed_file(file_path, model_name, db_path, collection_name):
             return True  # Consider it successful, nothing to do
 
         # Get the number of tokens for cost estimations
-        num_tokens = num_tokens_from_string(content)
-
-        print(
-            f"[blue]Embedding the context from: {file_path}, {model_name}, tokens: {num_tokens}[/blue]"
-        )
-
-        # Get the embedding model
-        embedding_model = llm.get_embedding_model(model_name)
+        num_tokens = num_tokens_from_string(content) if count_tokens else None
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Embedding the context from: %s, %s, tokens: %s",
+                file_path,
+                model_name,
+                num_tokens if count_tokens else f"~{estimate_tokens(content)}",
+            )
 
         # Create metadata
         metadata = {
             "path": file_path,
-            "tokens": num_tokens,
             "timestamp": asyncio.get_event_loop().time(),
         }
+        if count_tokens:
+            metadata["tokens"] = num_tokens
 
-        # Use a dedicated connection with appropriate settings
-        with get_db_connection(db_path, timeout=60.0) as conn:
-            db = sqlite_utils.Database(conn)
-            # Get or create the collection
-            collection = llm.Collection(collection_name, db, model=embedding_model)
-            # Embed the content and store in the collection
-            collection.embed(file_id, content, metadata=metadata, store=True)
-            return True
+        # Get or create the collection
+        collection = get_collection(db_path, collection_name, model_name)
+        # Embed the content and store in the collection
+        collection.embed(file_id, content, metadata=metadata, store=True)
+        return True
 
     except Exception as e:
         print(f"[yellow]⚠️ Failed to embed {file_path}: {str(e)}[/yellow]")
         return False
 
 
-async def embed_files_batch(files, model_name, db_path, collection_name, batch_size=5):
-    """Embed multiple files in batches for better performance"""
-    try:
-        if not files:
-            return []
-
-        # Get the embedding model
-        embedding_model = llm.get_embedding_model(model_name)
+def ensure_collection(db_path, collection_name, model_name):
+    """
+    Create the collection up front, before concurrent workers embed into it.
 
-        # Prepare the batch data
-        batch_data = []
-        for file_path in files:
-            try:
-                # Calculate the file ID (relative path)
-                file_id = os.path.relpath(file_path, os.getcwd())
+    llm.Collection inserts the collections row on first use, so workers
+    starting at the same time on a new collection would race to create it.
+    """
+    get_collection(db_path, collection_name, model_name)
 
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read()
 
-                # Skip empty files
-                if not content:
-                    print(f"[yellow]⚠️ Empty file: {file_path}[/yellow]")
-                    continue
+def fit_input(content, num_tokens=None):
+    """
+    Cut text down to what the model accepts as a single input.
 
-                # Get the number of tokens for cost estimations
-                num_tokens = num_tokens_from_string(content)
+    Only a real tiktoken count decides: texts whose estimate_tokens() is
+    within MAX_INPUT_TOKENS are returned untouched, the rest are counted,
+    and those over the limit keep their first MAX_INPUT_TOKENS tokens, so
+    they are embedded by their opening section instead of failing.
 
-                metadata = {
-                    "path": file_path,
-                    "tokens": num_tokens,
-                    "timestamp": asyncio.get_event_loop().time(),
-                }
+    Args:
+        content: Text to embed
+        num_tokens: Its token count if already counted, or None
 
-                # Add to batch
-                batch_data.append((file_id, content, metadata))
+    Returns:
+        (content, truncated) tuple
+    """
+    if num_tokens is None and estimate_tokens(content) <= MAX_INPUT_TOKENS:
+        return content, False
+    if num_tokens is not None and num_tokens <= MAX_INPUT_TOKENS:
+        return content, False
 
-                print(
-                    f"[blue]Preparing to embed: {file_path}, tokens: {num_tokens}[/blue]"
-                )
-            except Exception as e:
-                print(f"[yellow]⚠️ Failed to prepare {file_path}: {str(e)}[/yellow]")
+    encoding = get_encoding()
+    tokens = encoding.encode_ordinary(content)
+    if len(tokens) <= MAX_INPUT_TOKENS:
+        return content, False
+    return encoding.decode(tokens[:MAX_INPUT_TOKENS]), True
 
-        # Process files sequentially to avoid locking issues
-        results = []
-        for i, (file_id, content, meta) in enumerate(batch_data):
-            print(f"[green]Processing file {i+1}/{len(batch_data)} - {file_id}[/green]")
 
-            # Use a dedicated connection with appropriate settings
-            try:
-                with get_db_connection(db_path, timeout=30.0) as conn:
-                    db = sqlite_utils.Database(conn)
-                    collection = llm.Collection(
-                        collection_name, db, model=embedding_model
-                    )
-                    collection.embed(file_id, content, metadata=meta, store=True)
-                    results.append(True)
-                    print(f"[green]✓ Successfully embedded {file_id}[/green]")
-            except Exception as e:
-                print(f"[red]❌ Failed to embed {file_id}: {str(e)}[/red]")
-                results.append(False)
+def _is_input_error(error):
+    """
+    Return True if an embedding request failed because of one of its inputs.
 
-            # Add delay between files to reduce contention
-            await asyncio.sleep(0.5)
+    Covers HTTP 400 responses (openai's BadRequestError and the like) and
+    context-length errors; auth, network, rate-limit and model errors are
+    not, since retrying smaller batches would only repeat them.
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if status == 400 or "BadRequest" in type(error).__name__:
+        return True
+    message = str(error).lower()
+    return "context length" in message or "maximum context" in message
 
-        return results
-    except Exception as e:
-        print(f"[red]Error in batch embedding: {str(e)}[/red]")
-        return [False] * len(files)
 
+def embed_entries(collection, entries):
+    """
+    Embed (id, content, metadata) entries in one request and store them.
 
-# FUNCTIONS FOR CHUNKS
+    If the model rejects the request because of an input, the batch is
+    split in half and each half retried, so the offending input fails on
+    its own instead of taking the rest of the batch with it. Any other
+    error is raised for the caller to fail the batch once.
 
+    Args:
+        collection: The llm.Collection to store the embeddings in
+        entries: List of (id, content, metadata) tuples
 
-@with_retry(max_retries=5, initial_delay=1.0)
-async def embed_chunk(
-    chunk_id, content, metadata, model_name, db_path, collection_name
-):
-    """Embed a single chunk with retry logic"""
-    print(
-        f"[blue]Embedding chunk: {chunk_id}, tokens: {metadata.get('tokens', 0)}[/blue]"
+    Returns:
+        List of booleans, one per entry, True where it was embedded
+    """
+    try:
+        collection.embed_multi_with_metadata(
+            entries, batch_size=len(entries), store=True
+        )
+        return [True] * len(entries)
+    except Exception as e:
+        if not _is_input_error(e):
+            raise
+        if len(entries) == 1:
+            print(f"[red]❌ Failed to embed {entries[0][0]}: {str(e)}[/red]")
+            return [False]
+    middle = len(entries) // 2
+    return embed_entries(collection, entries[:middle]) + embed_entries(
+        collection, entries[middle:]
     )
 
-    # Get the embedding model
-    embedding_model = llm.get_embedding_model(model_name)
 
-    with get_db_connection(db_path, timeout=30.0) as conn:
-        db = sqlite_utils.Database(conn)
-        collection = llm.Collection(collection_name, db, model=embedding_model)
-        collection.embed(chunk_id, content, metadata=metadata, store=True)
+def _embed_entries(entries, model_name, db_path, collection_name):
+    """Embed entries for embed_files_batch in this thread's collection."""
+    collection = get_collection(db_path, collection_name, model_name)
+    return embed_entries(collection, entries)
 
-    return True
 
+def _load_file(file_path, cwd):
+    """
+    Read one file for embed_files_batch.
 
-async def embed_chunks(file_path, model_name, db_path, collection_name):
-    """Extract and embed code chunks from a file"""
-    try:
-        # Check if the file exists
-        if not os.path.exists(file_path):
-            print(f"[yellow]⚠️ File not found: {file_path}[/yellow]")
-            return False
+    Args:
+        file_path: Path of the file to read
+        cwd: Working directory the file ID is made relative to, looked up
+            once per run by the caller
 
-        # Calculate the file ID (relative path)
-        file_id = os.path.relpath(file_path, os.getcwd())
+    Returns:
+        (file_id, content, metadata) or None if the file is empty or
+        unreadable; token counts and the timestamp are added by the caller
+    """
+    try:
+        content = read_text(file_path)
 
-        print(f"[blue]Extracting chunks from: {file_path}[/blue]")
+        # Skip empty files
+        if not content:
+            print(f"[yellow]⚠️ Empty file: {file_path}[/yellow]")
+            return None
 
-        # Extract chunks using Tree-sitter or fallback to regex
-        chunks = treesitter_utils.extract_chunks_from_file(file_path)
+        # Calculate the file ID (relative path)
+        file_id = os.path.relpath(file_path, cwd)
 
-        if not chunks:
-            print(f"[yellow]⚠️ No chunks extracted from: {file_path}[/yellow]")
-            return False
+        return file_id, content, {"path": file_path}
+    except Exception as e:
+        print(f"[yellow]⚠️ Failed to prepare {file_path}: {str(e)}[/yellow]")
+        return None
 
-        print(f"[green]✓ Extracted {len(chunks)} chunks from {file_path}[/green]")
 
-        # Get the embedding model
-        embedding_model = llm.get_embedding_model(model_name)
+async def embed_files_batch(
+    files, model_name, db_path, collection_name, batch_size=100, count_tokens=False
+):
+    """
+    Embed multiple files in batches for better performance.
 
-        # Set up the chunk tables first, before doing any embedding
-        db_utils.setup_chunk_tables(db_path)
+    Files are read as they are pulled from files, which may be a lazy
+    iterator such as file_utils.iter_files, and each batch is sent to the
+    model as soon as it is ready, so discovery, reading and embedding overlap.
+    Token counts are only stored with count_tokens; otherwise requests are
+    sized by estimate_tokens().
 
-        # Embed each chunk one at a time
-        successfully_embedded = []
-        for chunk in chunks:
+    A batch the model rejects is recorded as failed files, but errors walking
+    the project or setting up the collection are raised once the batches
+    already queued have been embedded.
+    """
+    results = []
+    queue = asyncio.Queue(maxsize=MAX_INFLIGHT)
+    workers = []
+
+    async def consume():
+        while True:
+            entries = await queue.get()
+            if entries is None:
+                return
             try:
-                chunk_id = chunk["id"]
-                content = chunk["content"]
-
-                # Skip empty chunks
-                if not content.strip():
-                    continue
-
-                # Get the number of tokens for cost estimations
-                num_tokens = num_tokens_from_string(content)
-
-                # Add to metadata
-                chunk["metadata"] = {
-                    "tokens": num_tokens,
-                    "type": chunk["type"],
-                    "name": chunk["name"],
-                    "path": chunk["path"],
-                    "start_line": chunk["start_line"],
-                    "end_line": chunk["end_line"],
-                    "parent_id": chunk.get("parent_id"),
-                    "timestamp": asyncio.get_event_loop().time(),
-                }
-
-                # Attempt to embed with retries
-                try:
-                    success = await embed_chunk(
-                        chunk_id,
-                        content,
-                        chunk["metadata"],
-                        model_name,
-                        db_path,
-                        collection_name,
-                    )
-                    if success:
-                        successfully_embedded.append(chunk)
-                        # Small delay between embeddings to reduce contention
-                        await asyncio.sleep(0.5)
-                except Exception as err:
-                    print(
-                        f"[yellow]⚠️ Failed to embed chunk {chunk_id}: {str(err)}[/yellow]"
-                    )
-
+                outcomes = await asyncio.to_thread(
+                    _embed_entries, entries, model_name, db_path, collection_name
+                )
+                results.extend(outcomes)
+                # One line per request rather than one per file
+                print(f"[blue]Embedded {outcomes.count(True)} files[/blue]")
             except Exception as e:
+                print(f"[red]❌ Failed to embed {len(entries)} files: {str(e)}[/red]")
+                results.extend([False] * len(entries))
+
+    async def flush(pending):
+        # Get the number of tokens for cost estimations, for the whole
+        # buffer at once
+        if count_tokens:
+            token_counts = num_tokens_from_strings([entry[1] for entry in pending])
+        else:
+            token_counts = [estimate_tokens(entry[1]) for entry in pending]
+        debug = logger.isEnabledFor(logging.DEBUG)
+        sized = []
+        for entry, num_tokens in zip(pending, token_counts):
+            file_id, content, metadata = entry
+            if count_tokens:
+                metadata["tokens"] = num_tokens
+            content, truncated = fit_input(
+                content, num_tokens if count_tokens else None
+            )
+            if truncated:
                 print(
-                    f"[yellow]⚠️ Failed to process chunk {chunk.get('id', 'unknown')}: {str(e)}[/yellow]"
+                    f"[yellow]⚠️ {metadata['path']} is too long to embed whole; "
+                    "embedding its beginning only[/yellow]"
                 )
-
-        # Store chunks in the chunks table only once, after all embeddings
-        if successfully_embedded:
-            # Use a separate connection for storing chunks to avoid locks
-            with get_db_connection(db_path, timeout=30.0) as conn:
-                db = sqlite_utils.Database(conn)
-                # Store chunks with a dedicated connection
-                db_utils.store_chunks_with_db(
-                    db, collection_name, successfully_embedded
+                metadata["truncated"] = True
+                entry = (file_id, content, metadata)
+                num_tokens = estimate_tokens(content)
+            if debug:
+                logger.debug(
+                    "Preparing to embed: %s, tokens: %s%s",
+                    metadata["path"],
+                    "" if count_tokens else "~",
+                    num_tokens,
                 )
+            sized.append((entry, num_tokens))
+
+        if not workers:
+            # Create the collection before the workers race to insert it
+            ensure_collection(db_path, collection_name, model_name)
+            workers.extend(asyncio.create_task(consume()) for _ in range(MAX_INFLIGHT))
+
+        # Similar-length files share a batch, so no request is held up by
+        # one much larger file
+        sized.sort(key=lambda item: len(item[0][1]))
+
+        # Close a batch at batch_size files or MAX_BATCH_TOKENS tokens
+        batch, batch_tokens = [], 0
+        for entry, num_tokens in sized:
+            if batch and (
+                len(batch) >= batch_size or batch_tokens + num_tokens > MAX_BATCH_TOKENS
+            ):
+                # Waits for a free slot when the workers are behind
+                await queue.put(batch)
+                batch, batch_tokens = [], 0
+            batch.append(entry)
+            batch_tokens += num_tokens
+        if batch:
+            await queue.put(batch)
+        # Let an idle worker pick the batches up before reading more files
+        await asyncio.sleep(0)
+
+    try:
+        # File IDs are relative to the working directory at the start
+        cwd = os.getcwd()
+        files = iter(files)
+        # Read a few batches' worth at a time rather than holding every
+        # file's content until discovery finishes
+        while paths := list(islice(files, batch_size * 4)):
+            # Reads block, so overlap them in the default thread pool
+            loaded = await asyncio.gather(
+                *(asyncio.to_thread(_load_file, file_path, cwd) for file_path in paths)
+            )
+            pending = [entry for entry in loaded if entry is not None]
+            now = asyncio.get_running_loop().time()
+            for _, _, metadata in pending:
+                metadata["timestamp"] = now
+
+            if pending:
+                await flush(pending)
+    finally:
+        # Let the workers drain whatever was queued
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    if results:
+        print(f"[green]✓ Successfully embedded {results.count(True)} files[/green]")
+
+    return results
 
-        return (
-            len(successfully_embedded) > 0
-        )  # Success if at least one chunk was embedded
+
+# FUNCTIONS FOR CHUNKS
+
+
+def prepare_chunks(file_path, count_tokens=False):
+    """
+    Extract the chunks from a file and attach their embedding metadata.
+
+    Args:
+        file_path: Path of the file to chunk
+        count_tokens: Whether to count each chunk's tokens into its metadata
+
+    Returns:
+        List of non-empty chunk dictionaries, each with a "metadata" entry
+    """
+    # Check if the file exists
+    if not os.path.exists(file_path):
+        print(f"[yellow]⚠️ File not found: {file_path}[/yellow]")
+        return []
+
+    # Extract chunks using Tree-sitter or fallback to regex
+    chunks = treesitter_utils.extract_chunks_from_file(file_path)
+
+    if not chunks:
+        logger.debug("No chunks extracted from: %s", file_path)
+        return []
+
+    # One timestamp for the whole file; the event loop's clock is
+    # time.monotonic(), and prepare_chunks may run outside a loop
+    now = time.monotonic()
+
+    prepared = []
+    for chunk in chunks:
+        # Skip empty chunks
+        if not chunk["content"].strip():
+            continue
+
+        chunk["metadata"] = {
+            "type": chunk["type"],
+            "name": chunk["name"],
+            "path": chunk["path"],
+            "start_line": chunk["start_line"],
+            "end_line": chunk["end_line"],
+            "parent_id": chunk.get("parent_id"),
+            "timestamp": now,
+        }
+        if count_tokens:
+            # Get the number of tokens for cost estimations
+            chunk["metadata"]["tokens"] = num_tokens_from_string(chunk["content"])
+        prepared.append(chunk)
+
+    return prepared
+
+
+@with_retry(max_retries=5, initial_delay=1.0)
+async def embed_prepared_chunks(
+    chunks, model_name, db_path, collection_name, batch_size=CHUNK_BATCH_SIZE
+):
+    """
+    Embed chunks from prepare_chunks in batched model calls and store them.
+
+    Args:
+        chunks: List of chunk dictionaries returned by prepare_chunks
+        model_name: Name of the embedding model
+        db_path: Path to the SQLite database
+        collection_name: Name of the collection to embed into
+        batch_size: Number of chunks sent to the model per request
+
+    Returns:
+        List of booleans, one per chunk, True where it was embedded and
+        stored
+    """
+    if not chunks:
+        return []
+
+    print(f"[blue]Embedding {len(chunks)} chunks[/blue]")
+
+    # The model call and the SQLite writes both block, so run them in a
+    # worker thread and leave the event loop free for other files
+    return await asyncio.to_thread(
+        _embed_and_store_chunks,
+        chunks,
+        model_name,
+        db_path,
+        collection_name,
+        batch_size,
+    )
+
+
+def _embed_and_store_chunks(chunks, model_name, db_path, collection_name, batch_size):
+    """Blocking half of embed_prepared_chunks."""
+    collection = get_collection(db_path, collection_name, model_name)
+
+    outcomes = []
+    for start in range(0, len(chunks), batch_size):
+        entries = []
+        for chunk in chunks[start : start + batch_size]:
+            # Only the embedded text is cut; the chunks table keeps it whole
+            content, _ = fit_input(
+                chunk["content"], chunk["metadata"].get("tokens")
+            )
+            entries.append((chunk["id"], content, chunk["metadata"]))
+        outcomes.extend(embed_entries(collection, entries))
+
+    embedded = [chunk for chunk, ok in zip(chunks, outcomes) if ok]
+    if embedded and not db_utils.store_chunks_with_db(
+        collection.db, collection_name, embedded
+    ):
+        return [False] * len(chunks)
+    return outcomes
+
+
+async def embed_chunks(
+    file_path, model_name, db_path, collection_name, count_tokens=False
+):
+    """Extract and embed code chunks from a file"""
+    try:
+        # Reading and parsing block, so keep them off the event loop
+        chunks = await asyncio.to_thread(prepare_chunks, file_path, count_tokens)
+        outcomes = await embed_prepared_chunks(
+            chunks, model_name, db_path, collection_name
+        )
+        return bool(outcomes) and all(outcomes)
     except Exception as e:
         print(f"[yellow]⚠️ Failed to process chunks from {file_path}: {str(e)}[/yellow]")
         return False
 
 
-async def embed_chunks_batch(files, model_name, db_path, collection_name, batch_size=5):
+async def embed_chunks_batch(
+    files, model_name, db_path, collection_name, batch_size=5, count_tokens=False
+):
     """Extract and embed code chunks from multiple files in batches"""
     try:
         if not files:
             return []
 
-        # Process files sequentially to avoid database contention
-        results = []
-        for i, file_path in enumerate(files):
-            print(f"[blue]Processing file {i+1}/{len(files)}: {file_path}[/blue]")
+        ensure_collection(db_path, collection_name, model_name)
 
-            # Process chunks for each file individually
-            success = await embed_chunks(
-                file_path, model_name, db_path, collection_name
-            )
-            results.append(success)
+        # Keep at most MAX_INFLIGHT files in flight so the embedding API
+        # isn't flooded into rate limiting
+        semaphore = asyncio.Semaphore(MAX_INFLIGHT)
 
-            # Add a delay between files to reduce database contention
-            await asyncio.sleep(1.0)
+        async def process(i, file_path):
+            async with semaphore:
+                logger.debug("Processing file %d/%d: %s", i + 1, len(files), file_path)
+                return await embed_chunks(
+                    file_path, model_name, db_path, collection_name, count_tokens
+                )
+
+        results = await asyncio.gather(
+            *(process(i, file_path) for i, file_path in enumerate(files))
+        )
 
         return results
     except Exception as e:
@@ -325,8 +596,75 @@ async def embed_chunks_batch(files, model_name, db_path, collection_name, batch_
         return [False] * len(files)
 
 
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base") -> tiktoken.Encoding:
+    """Returns the tiktoken encoding, loading it only once per process."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+def estimate_tokens(text):
+    """
+    Estimate a text's token count without tokenizing it.
+
+    Source code runs about 3-4 characters per token with cl100k_base; this
+    takes the low end so request budgets built on it stay under the limit.
+    """
+    return len(text) // 3
+
+
+# Texts longer than this are counted in line-aligned shards of about
+# TEXT_SHARD_CHARS, which tiktoken encodes in parallel
+LARGE_TEXT_CHARS = 256_000
+TEXT_SHARD_CHARS = 64_000
+
+
+def _text_shards(text):
+    """Split text into pieces of about TEXT_SHARD_CHARS, ending at newlines."""
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start + TEXT_SHARD_CHARS)
+        end = len(text) if end == -1 else end + 1
+        yield text[start:end]
+        start = end
+
+
+# Repeated chunks (license headers, boilerplate methods) are counted once;
+# bounded so a run doesn't keep every chunk's text alive
+@lru_cache(maxsize=1024)
 def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(string))
+    if len(string) > LARGE_TEXT_CHARS:
+        return num_tokens_from_strings([string], encoding_name)[0]
+
+    encoding = get_encoding(encoding_name)
+    # Source text is counted as plain text, so no special-token scan, and
+    # a stray "<|endoftext|>" in a file can't make encode() raise
+    num_tokens = len(encoding.encode_ordinary(string))
     return num_tokens
+
+
+def num_tokens_from_strings(strings, encoding_name: str = "cl100k_base"):
+    """
+    Returns the number of tokens in each text string, encoded in parallel.
+
+    Very large strings are split on line boundaries and their shards
+    counted separately, so one huge file is spread across the threads
+    instead of encoded on one. Tokens don't span newlines in practice, so
+    the sum matches a whole-string count to within a token or two.
+    """
+    shards = []
+    owners = []
+    for index, string in enumerate(strings):
+        parts = _text_shards(string) if len(string) > LARGE_TEXT_CHARS else (string,)
+        for part in parts:
+            shards.append(part)
+            owners.append(index)
+
+    encoding = get_encoding(encoding_name)
+    # tiktoken releases the GIL while encoding, so the threads run in parallel
+    batches = encoding.encode_ordinary_batch(shards, num_threads=os.cpu_count() or 1)
+
+    counts = [0] * len(strings)
+    for index, tokens in zip(owners, batches):
+        counts[index] += len(tokens)
+    return counts
@@ -2,16 +2,74 @@ import os
 import subprocess
 import fnmatch
 import math  # Add this import
+import re
+import stat
+
+
+# Directory names skipped when walking a project without git
+DEFAULT_EXCLUDE_PATTERNS = [
+    ".git",
+    ".kaze",
+    "node_modules",
+    ".DS_Store",
+    "build",
+    "dist",
+    "venv",
+    "__pycache__",
+    ".*cache",
+]
+
+
+def compile_patterns(patterns):
+    """Compile glob patterns into a single regex, or None if there are none."""
+    patterns = [pattern for pattern in patterns if pattern]
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns))
+
+
+def walk_files(root, dir_exclude=None, exclude=None):
+    """
+    Yield an os.DirEntry for each file under root using os.scandir.
+
+    Directories whose name matches dir_exclude or exclude are pruned without
+    being entered; files whose name matches exclude are skipped.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if exclude and exclude.match(entry.name):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if not (dir_exclude and dir_exclude.match(entry.name)):
+                            stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+        except OSError:
+            continue
 
 
 def get_file_list(project_dir, include_pattern=None, exclude_pattern=None):
     """
     Returns a list of files to process based on git repository, .gitignore file, and include/exclude patterns.
     """
+    return list(iter_files(project_dir, include_pattern, exclude_pattern))
+
+
+def iter_files(project_dir, include_pattern=None, exclude_pattern=None):
+    """
+    Yield the files to process, as get_file_list does, as they are found.
+    """
 
     file_list = []
     print(f"getting file list with {project_dir}")
 
+    # Compile the glob patterns once rather than fnmatch-ing every name
+    exclude = compile_patterns([exclude_pattern])
+
     if os.path.exists(os.path.join(project_dir, ".gitignore")) and os.path.isdir(
         os.path.join(project_dir, ".git")
     ):
@@ -42,63 +100,67 @@ def get_file_list(project_dir, include_pattern=None, exclude_pattern=None):
 
         except Exception as e:
             print(f"[yellow]⚠️ Error using git: {e}[/yellow]")
-            return []
+            return
+
+        if exclude:
+            # git paths always use "/" separators
+            file_list = [
+                file
+                for file in file_list
+                if not any(exclude.match(part) for part in file.split("/"))
+            ]
 
     else:
-        # Use find command with basic exclusions
+        # Walk the tree, pruning excluded directories before entering them
         print("[yellow]⚠️ No .gitignore found - using basic exclusions[/yellow]")
-        exclude_patterns = [
-            ".git",
-            ".kaze",
-            "node_modules",
-            ".DS_Store",
-            "build",
-            "dist",
-            "venv",
-            "__pycache__",
-            ".*cache",
-        ]
-        for root, dirs, files in os.walk(project_dir):
-            dirs[:] = [
-                d
-                for d in dirs
-                if not any(fnmatch.fnmatch(d, pattern) for pattern in exclude_patterns)
-            ]
-            for file in files:
-                file_list.append(os.path.join(root, file))
+        for entry in walk_files(
+            project_dir,
+            dir_exclude=compile_patterns(DEFAULT_EXCLUDE_PATTERNS),
+            exclude=exclude,
+        ):
+            # scandir already knows it's a file; reuse its stat for the size
+            if should_process_file(entry.path, file_size=entry.stat().st_size):
+                yield entry.path
+
+    # Filter for processable files
+    for file in file_list:
+        if should_process_file(file):
+            yield file
 
     if include_pattern:
         print(
             f"[blue]🔍 Adding files matching pattern: [yellow]{include_pattern}[/yellow][/blue]"
         )
-        additional_files = []
-        for root, _, files in os.walk(project_dir):
-            for file in files:
-                if fnmatch.fnmatch(file, include_pattern):
-                    additional_files.append(os.path.join(root, file))
-        file_list.extend(additional_files)
-
-    # Filter the list for processable files
-    processable_files = []
-    for file in file_list:
-        if should_process_file(file):
-            processable_files.append(file)
+        include = compile_patterns([include_pattern])
+        for entry in walk_files(project_dir, exclude=exclude):
+            if include.match(entry.name) and should_process_file(
+                entry.path, file_size=entry.stat().st_size
+            ):
+                yield entry.path
 
-    return processable_files
 
-
-def should_process_file(file_path, max_file_size_kb=100):
+def should_process_file(file_path, max_file_size_kb=None, file_size=None):
     """
     Checks if a file should be processed based on size and type.
+
+    max_file_size_kb defaults to should_process_file.max_file_size_kb. Pass
+    file_size (in bytes) when it is already known, e.g. from a DirEntry, to
+    skip statting the file again.
     """
-    if not os.path.isfile(file_path):
-        return False
+    if max_file_size_kb is None:
+        max_file_size_kb = should_process_file.max_file_size_kb
 
-    if not os.access(file_path, os.R_OK):
-        return False
+    if file_size is None:
+        # One stat answers both "is it a regular file" and "how big is it"
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return False
+        if not stat.S_ISREG(file_stat.st_mode):
+            return False
+        file_size = file_stat.st_size
 
-    file_size_kb = os.path.getsize(file_path) / 1024
-    if file_size_kb > max_file_size_kb:
+    if file_size / 1024 > max_file_size_kb:
         return False
 
     try:
@@ -108,6 +170,9 @@ def should_process_file(file_path, max_file_size_kb=100):
                 is_text_file = True
             except UnicodeDecodeError:
                 is_text_file = False
+    except PermissionError:
+        # Unreadable files are skipped quietly
+        return False
     except Exception:
         print(f"Error determining if the file {file_path} is a text file, excluding")
         return False
@@ -155,6 +220,10 @@ def should_process_file(file_path, max_file_size_kb=100):
     return True
 
 
+# Size limit used when none is passed; create sets this from --size
+should_process_file.max_file_size_kb = 100
+
+
 def get_file_size(file_path):
     """returns the size of the file in human readable format"""
 
@@ -4,6 +4,7 @@ This module handles the parsing of source code files using Tree-sitter,
 extracting hierarchical code chunks based on language syntax.
 """
 
+import os
 from typing import Dict, List, Optional, Any
 from rich import print
 
@@ -18,7 +19,7 @@ except ImportError:
         "[yellow]⚠️ tree-sitter package not available. Falling back to regex-based parsing.[/yellow]"
     )
 
-from kaze.languages import get_language_parser, get_supported_languages
+from kaze.languages import get_language_parser, get_language_for_extension
 
 
 def detect_language(file_path: str) -> Optional[str]:
@@ -31,15 +32,9 @@ def detect_language(file_path: str) -> Optional[str]:
     Returns:
         Language ID string or None if the language is not supported
     """
-    # Get all supported languages
-    supported_languages = get_supported_languages()
-
-    # Check each language parser to see if it can handle this file
-    for language_id, parser_class in supported_languages.items():
-        if parser_class.can_handle_file(file_path):
-            return language_id
-
-    return None
+    # One dict lookup instead of asking every registered parser
+    _, ext = os.path.splitext(file_path)
+    return get_language_for_extension(ext)
 
 
 def extract_chunks_from_file(file_path: str) -> List[Dict[str, Any]]:
@@ -75,7 +70,6 @@ def extract_chunks_from_file(file_path: str) -> List[Dict[str, Any]]:
         # Extract chunks
         chunks = parser.extract_chunks(source_code, file_path)
 
-        print(f"[green]✓ Extracted {len(chunks)} chunks from {file_path}[/green]")
         return chunks
 
     except Exception as e:
@@ -9,10 +9,15 @@ from kaze.languages.base import BaseLanguageParser
 # Registry of language parsers
 _LANGUAGE_PARSERS: Dict[str, Type[BaseLanguageParser]] = {}
 
+# File extension (lowercase, with the dot) -> language ID
+_EXTENSION_LANGUAGES: Dict[str, str] = {}
+
 
 def register_language(language_id: str, parser_class: Type[BaseLanguageParser]):
     """Register a language parser class."""
     _LANGUAGE_PARSERS[language_id] = parser_class
+    for extension in parser_class.FILE_EXTENSIONS:
+        _EXTENSION_LANGUAGES[extension.lower()] = language_id
     print(f"Registered language parser for: {language_id}")
 
 
@@ -21,6 +26,11 @@ def get_language_parser(language_id: str) -> Optional[Type[BaseLanguageParser]]:
     return _LANGUAGE_PARSERS.get(language_id)
 
 
+def get_language_for_extension(extension: str) -> Optional[str]:
+    """Get the language ID registered for a file extension such as ".py"."""
+    return _EXTENSION_LANGUAGES.get(extension.lower())
+
+
 def get_supported_languages() -> Dict[str, Type[BaseLanguageParser]]:
     """Get all supported languages."""
     return _LANGUAGE_PARSERS.copy()
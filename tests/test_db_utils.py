@@ -0,0 +1,134 @@
+import random
+import sqlite3
+import struct
+
+import pytest
+
+sqlite_utils = pytest.importorskip("sqlite_utils")
+
+from kaze.core import db_utils  # noqa: E402
+
+
+def _embeddings_db(vectors, collection_id=1):
+    """An in-memory database with llm's embeddings table holding vectors."""
+    db = sqlite_utils.Database(sqlite3.connect(":memory:"))
+    db.execute(
+        """
+        CREATE TABLE embeddings (
+            collection_id INTEGER,
+            id TEXT,
+            embedding BLOB,
+            content TEXT,
+            content_blob BLOB,
+            content_hash BLOB,
+            metadata TEXT,
+            updated INTEGER,
+            PRIMARY KEY (collection_id, id)
+        )
+        """
+    )
+    for id_, vector in vectors.items():
+        db.execute(
+            "INSERT INTO embeddings (collection_id, id, embedding) VALUES (?, ?, ?)",
+            [collection_id, id_, struct.pack("<%df" % len(vector), *vector)],
+        )
+    db.conn.commit()
+    return db
+
+
+def _random_vectors(count, dimensions=16, seed=0):
+    rng = random.Random(seed)
+    return {
+        f"doc{i}": [rng.uniform(-1, 1) for _ in range(dimensions)]
+        for i in range(count)
+    }
+
+
+def test_vector_index_matches_full_scan():
+    pytest.importorskip("sqlite_vec")
+    vectors = _random_vectors(200)
+    db = _embeddings_db(vectors)
+    query = _random_vectors(1, seed=1)["doc0"]
+
+    expected = db_utils.similar_by_vector(db, 1, query, number=10)
+    assert db_utils.create_vector_index(db, 1)
+    assert db_utils.has_vector_index(db, 1)
+    # Called directly so a failing index query can't fall back to the scan
+    actual = db_utils._similar_by_vector_index(db, 1, query, 10, None)
+
+    assert [r["id"] for r in actual] == [r["id"] for r in expected]
+    for got, want in zip(actual, expected):
+        assert got["score"] == pytest.approx(want["score"], abs=1e-5)
+
+
+def test_vector_index_survives_renumbered_rowids():
+    pytest.importorskip("sqlite_vec")
+    vectors = _random_vectors(50)
+    db = _embeddings_db(vectors)
+    assert db_utils.create_vector_index(db, 1)
+
+    # Re-store every embedding the way llm's store=True does, which gives
+    # each row a new rowid
+    for id_ in reversed(list(vectors)):
+        row = db.execute(
+            "SELECT collection_id, id, embedding FROM embeddings WHERE id = ?", [id_]
+        ).fetchone()
+        db.execute(
+            "INSERT OR REPLACE INTO embeddings (collection_id, id, embedding) "
+            "VALUES (?, ?, ?)",
+            row,
+        )
+    db.conn.commit()
+
+    query = vectors["doc7"]
+    actual = db_utils._similar_by_vector_index(db, 1, query, 5, None)
+    assert actual[0]["id"] == "doc7"
+    # The same data without an index is answered by the full scan
+    expected = db_utils.similar_by_vector(_embeddings_db(vectors), 1, query, number=5)
+    assert [r["id"] for r in actual] == [r["id"] for r in expected]
+
+
+def _chunk(chunk_id, content, path="pkg/module.py"):
+    return {
+        "id": chunk_id,
+        "type": "function",
+        "name": chunk_id,
+        "path": path,
+        "start_line": 1,
+        "start_col": 0,
+        "end_line": 2,
+        "end_col": 0,
+        "content": content,
+        "metadata": {},
+    }
+
+
+def test_restoring_chunks_keeps_full_text_indexes_in_sync(tmp_path):
+    db = db_utils.open_db(str(tmp_path / "embeddings.db"))
+    db.execute(
+        "CREATE TABLE collections (id INTEGER PRIMARY KEY, name TEXT, model TEXT)"
+    )
+    db.execute("INSERT INTO collections (name, model) VALUES ('chunks', 'model')")
+    db.conn.commit()
+    db_utils.create_chunk_tables(db)
+    if not db_utils.has_chunk_text_index(db):
+        pytest.skip("this SQLite build has no FTS5")
+
+    assert db_utils.store_chunks_with_db(
+        db, "chunks", [_chunk("a", "def old_name(): pass")]
+    )
+    # Re-chunking the file stores the same chunk id again
+    assert db_utils.store_chunks_with_db(
+        db, "chunks", [_chunk("a", "def new_name(): pass", path="pkg/moved.py")]
+    )
+
+    def count(table):
+        return db.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+    assert count("chunks") == 1
+    assert count("chunks_fts") == 1
+    collection_id = db_utils.get_collection_id(db, "chunks")
+    assert db_utils.search_chunk_text(db, collection_id, "old_name", 10) == []
+    assert db_utils.search_chunk_text(db, collection_id, "new_name", 10) == ["a"]
+    if db_utils.has_chunk_path_index(db):
+        assert count("chunks_path_fts") == 1